@@ -1,22 +1,42 @@
-from flask import Flask, request, jsonify, session, redirect, send_from_directory
+from flask import Flask, Response, request, jsonify, session, redirect, send_file
 from flask_cors import CORS
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import os
 import json
 import re
-from datetime import datetime, timedelta
+from datetime import datetime
 # REMOVED: from lyricsgenius import Genius
 from dotenv import load_dotenv
+import click
 import time
+import threading
+import uuid
+import itertools
+import hashlib
+import gzip
+import struct
+import zlib
+import mimetypes
+import queue
 import webbrowser
-import requests
-from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import brotli  # Optional: without it only gzip variants of the frontend are served
+except ImportError:
+    brotli = None
+from engine import (
+    log, metrics, ANALYSIS_JOB_WORKERS, CallbackGauge, job_tracks_per_second, StageProfile, active_profile, profiled_context, timed_stage,
+    SPOTIFY_SEARCH_TTL, LOCAL_LYRICS_DB, MATCH_FORMATS, MemoryStateStore, SQLiteStateStore, word_list_index,
+    get_flagged_matcher, get_local_lyrics_index, iter_track_analyses, spotify_client, spotify_cached,
+    track_item_header, fetch_album_header, fetch_full_tracks, fetch_tracks_for_item,
+)
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__, static_folder="build", static_url_path="/")
+app = Flask(__name__, static_folder=None)  # The React build is served by StaticAssetIndex (see serve)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "defaultsecret")
 
 CORS(app, supports_credentials=True)
@@ -24,6 +44,16 @@ CORS(app, supports_credentials=True)
 app.config["SESSION_COOKIE_SAMESITE"] = "None"
 app.config["SESSION_COOKIE_SECURE"] = True
 
+# --- Metrics endpoint and opt-in per-request profiling (instruments live in engine.py) ---
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # When set, /metrics requires "Authorization: Bearer <token>"
+REQUEST_PROFILING = os.getenv("REQUEST_PROFILING", "1") != "0"  # Honour the X-Profile request header
+PROFILE_HEADER = "X-Profile"
+
+def start_request_profile():
+    """A StageProfile when the request asks for profiling (X-Profile: 1), else None"""
+    if not REQUEST_PROFILING or request.headers.get(PROFILE_HEADER, "").lower() not in ("1", "true", "yes"): return None
+    return StageProfile()
+
 # --- Spotify OAuth setup ---
 sp_oauth = SpotifyOAuth(
     client_id=os.getenv("SPOTIPY_CLIENT_ID"),
@@ -34,99 +64,191 @@ sp_oauth = SpotifyOAuth(
 
 # --- Pre-compiled regex patterns for performance ---
 SPOTIFY_URL_PATTERN = re.compile(r"open\.spotify\.com/(track|album|playlist)/([a-zA-Z0-9]+)")
-FEAT_PATTERN = re.compile(r"\s+\(feat\.[^)]+\)", re.IGNORECASE)
-FEAT_BRACKET_PATTERN = re.compile(r"\s+\[feat\.[^]]+\]", re.IGNORECASE)
-VERSION_PATTERN = re.compile(r"\s+\((Remix|Live|Acoustic|Radio Edit)\)", re.IGNORECASE)
-SUFFIX_PATTERN = re.compile(r"\s+-\s+(Remix|Live|Acoustic|Radio Edit|From .*|Mono|Stereo)", re.IGNORECASE)
-PART_VOL_PATTERN = re.compile(r"\s+\((Pt\.|Vol\.)\s*\d+\)", re.IGNORECASE)
-LRCLIB_TIME_PATTERN = re.compile(r"\[(\d+):(\d+\.\d+)\]\s*(.*)")
-WORD_BOUNDARY_PATTERN = re.compile(r'\b\w+\b')
-
-# --- Requests session for connection pooling ---
-requests_session = requests.Session()
-adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=3)
-requests_session.mount('http://', adapter)
-requests_session.mount('https://', adapter)
-
-# --- REMOVED: Genius API setup ---
-# GENIUS_ACCESS_TOKEN = os.getenv("GENIUS_API_TOKEN")
-# genius = None # Removed Genius client
-
-# --- Load multiple default word lists from subfolder ---
-DEFAULT_WORD_LISTS = {}
-WORD_LIST_FOLDER = "List-of-Dirty-Naughty-Obscene-and-Otherwise-Bad-Words"
-
-# (Code for loading DEFAULT_LIST_FILES remains the same...)
-DEFAULT_LIST_FILES = {
-    'ar': os.path.join(WORD_LIST_FOLDER, 'default_ar.txt'),
-    'zh': os.path.join(WORD_LIST_FOLDER, 'default_zh.txt'),
-    'cs': os.path.join(WORD_LIST_FOLDER, 'default_cs.txt'),
-    'da': os.path.join(WORD_LIST_FOLDER, 'default_da.txt'),
-    'nl': os.path.join(WORD_LIST_FOLDER, 'default_nl.txt'),
-    'en': os.path.join(WORD_LIST_FOLDER, 'default_en.txt'),
-    'eo': os.path.join(WORD_LIST_FOLDER, 'default_eo.txt'),
-    'fil': os.path.join(WORD_LIST_FOLDER, 'default_fil.txt'),
-    'fi': os.path.join(WORD_LIST_FOLDER, 'default_fi.txt'),
-    'fr': os.path.join(WORD_LIST_FOLDER, 'default_fr.txt'),
-    'fr-CA-u-sd-caqc': os.path.join(WORD_LIST_FOLDER, 'default_fr-CA-u-sd-caqc.txt'),
-    'de': os.path.join(WORD_LIST_FOLDER, 'default_de.txt'),
-    'hi': os.path.join(WORD_LIST_FOLDER, 'default_hi.txt'),
-    'hu': os.path.join(WORD_LIST_FOLDER, 'default_hu.txt'),
-    'it': os.path.join(WORD_LIST_FOLDER, 'default_it.txt'),
-    'ja': os.path.join(WORD_LIST_FOLDER, 'default_ja.txt'),
-    'kab': os.path.join(WORD_LIST_FOLDER, 'default_kab.txt'),
-    'tlh': os.path.join(WORD_LIST_FOLDER, 'default_tlh.txt'),
-    'ko': os.path.join(WORD_LIST_FOLDER, 'default_ko.txt'),
-    'no': os.path.join(WORD_LIST_FOLDER, 'default_no.txt'),
-    'fa': os.path.join(WORD_LIST_FOLDER, 'default_fa.txt'),
-    'pl': os.path.join(WORD_LIST_FOLDER, 'default_pl.txt'),
-    'pt': os.path.join(WORD_LIST_FOLDER, 'default_pt.txt'),
-    'ru': os.path.join(WORD_LIST_FOLDER, 'default_ru.txt'),
-    'es': os.path.join(WORD_LIST_FOLDER, 'default_es.txt'),
-    'sv': os.path.join(WORD_LIST_FOLDER, 'default_sv.txt'),
-    'th': os.path.join(WORD_LIST_FOLDER, 'default_th.txt'),
-    'tr': os.path.join(WORD_LIST_FOLDER, 'default_tr.txt'),
-}
-print("Loading default word lists...", flush=True)
-loaded_list_count = 0
-for lang_code, filepath in DEFAULT_LIST_FILES.items():
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                # Use set for O(1) lookup performance instead of list
-                words = {line.strip().lower() for line in f if line.strip()}
-                if words:
-                    DEFAULT_WORD_LISTS[lang_code] = words
-                    print(f"✅ Loaded {len(words)} words for '{lang_code}' from {filepath}.", flush=True)
-                    loaded_list_count += 1
-                else:
-                    print(f"⚠️ Warning: {filepath} for '{lang_code}' is empty.", flush=True)
-        except Exception as e:
-            print(f"❌ Error loading {filepath} for '{lang_code}': {e}", flush=True)
-    else:
-        print(f"⚠️ Warning: Default list file not found: {filepath} for '{lang_code}'.", flush=True)
-if loaded_list_count == 0:
-    print("❌ WARNING: No default word lists were loaded successfully! Check file paths and names.", flush=True)
-# --- End of word list loading ---
 
-# Progress store with automatic cleanup
-progress_store = {}
-progress_store_timestamps = {}  # Track when entries were created for cleanup
+# --- /wordlists payloads (the compiled index itself lives in engine.py) ---
+_word_list_payloads = {"version": None}
+_word_list_payloads_lock = threading.Lock()
+
+def get_word_list_payloads():
+    """
+    Serialized /wordlists bodies for the current index version, built once per version.
+
+    Returns a dict with "version", "manifest", "lists" (lang_code -> {"etag", "body", "gzip"})
+    and "me", the members /me adds after the user's own ({"body", "deflate"}, see me_response).
+    """
+    global _word_list_payloads
+    version = word_list_index.version
+    payloads = _word_list_payloads
+    if payloads["version"] == version: return payloads
+    with _word_list_payloads_lock:
+        if _word_list_payloads["version"] == version: return _word_list_payloads
+        lists = {}; manifest = {"version": version, "lists": {}}
+        for lang_code, words in sorted(word_list_index.lists.items()):
+            body = json.dumps({"lang": lang_code, "words": list(words)}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            etag = hashlib.sha256(body).hexdigest()[:20]
+            lists[lang_code] = {"etag": etag, "body": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            manifest["lists"][lang_code] = {"version": etag, "count": len(words), "url": f"/wordlists/{lang_code}?v={etag}"}
+        default_word_lists = {lang_code: list(words) for lang_code, words in word_list_index.lists.items()}
+        me_body = json_members({"word_lists": manifest, "default_word_lists": default_word_lists}).encode("utf-8") + b"}"
+        me_deflate = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        me = {"body": me_body, "deflate": me_deflate.compress(me_body) + me_deflate.flush()}
+        payloads = {"version": version, "manifest": manifest, "lists": lists, "me": me}
+        _word_list_payloads = payloads
+        log.info(f"Prepared word list payloads for index version {version}.")
+        return payloads
+
+def json_members(fields):
+    """`fields` as the comma-separated "key":value members of a JSON object, without the braces"""
+    return ",".join(f"{json.dumps(key)}:{json.dumps(value, separators=(',', ':'))}" for key, value in fields.items())
+
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"  # No name, mtime 0, unknown OS
+
+def me_response(user_fields, use_gzip):
+    """
+    /me body: the user's own fields followed by the cached word list members.
+
+    With gzip only the user's fields are compressed per request: they end on a sync
+    flush, so the word list members' deflate stream, compressed once per index
+    version, can follow as-is; the trailer's CRC covers both parts.
+    """
+    me = get_word_list_payloads()["me"]
+    head = ("{" + json_members(user_fields) + ",").encode("utf-8")
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "no-store"}
+    if not use_gzip: return Response(head + me["body"], mimetype="application/json", headers=headers)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    head_deflate = compressor.compress(head) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    crc = zlib.crc32(me["body"], zlib.crc32(head))
+    body = GZIP_HEADER + head_deflate + me["deflate"] + struct.pack("<II", crc, (len(head) + len(me["body"])) & 0xFFFFFFFF)
+    headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+# --- Shared state backend for job progress and results ---
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()  # "memory" (single process) or "sqlite" (shared by workers)
+STATE_STORE_PATH = os.getenv("STATE_STORE_PATH", "state_store.sqlite3")
+
+# --- Background analysis jobs ---
+JOB_RETENTION_SECONDS = 3600  # Job state stays retrievable this long after its last update
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "100"))  # Links accepted by one /analyze/batch request
+
+def make_state_store(ttl, max_weight=None, weigh=None):
+    """Shared store for STATE_BACKEND; `max_weight`/`weigh` bound the in-process store (see MemoryStateStore)"""
+    if STATE_BACKEND == "sqlite":
+        log.info(f"Using shared SQLite state store at {STATE_STORE_PATH}.")
+        return SQLiteStateStore(STATE_STORE_PATH, ttl)
+    if STATE_BACKEND != "memory":
+        log.warning(f"⚠️ Unknown STATE_BACKEND '{STATE_BACKEND}', using in-process state.")
+    return MemoryStateStore(ttl, max_weight, weigh)
+
+job_state_store = make_state_store(JOB_RETENTION_SECONDS)
+
+# Previous playlist results per word selection, for incremental re-analysis
+PLAYLIST_HISTORY_TTL = int(os.getenv("PLAYLIST_HISTORY_TTL", str(14 * 24 * 3600)))
+PLAYLIST_HISTORY_MAX_TRACKS = int(os.getenv("PLAYLIST_HISTORY_MAX_TRACKS", "50000"))  # Track results kept per worker with STATE_BACKEND=memory
+playlist_history_store = make_state_store(PLAYLIST_HISTORY_TTL, PLAYLIST_HISTORY_MAX_TRACKS, lambda history: max(1, len(history["results"])))
+
+class AnalysisJob:
+    """
+    One /analyze run executing in this process.
+
+    Every state change is written to `job_state_store` as a plain dict, which is what
+    /jobs and /progress read, so any worker can answer for a job running elsewhere.
+    A streaming job does not collect track results; each one is pushed onto `events`
+    for the open /analyze stream to forward, and only the item header is kept.
+    """
+    FINISHED_STATES = ("done", "error", "cancelled")
+
+    def __init__(self, owner, url, stream=False):
+        self.id = uuid.uuid4().hex
+        self.owner = owner; self.url = url
+        self.events = queue.Queue() if stream else None
+        self.status = "queued"; self.percent = 0; self.current_track = ""
+        self.result = None; self.error = None; self.http_status = 200
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def state_key(job_id): return f"job:{job_id}"
+    @staticmethod
+    def cancel_key(job_id): return f"cancel:{job_id}"
+    @staticmethod
+    def owner_key(owner): return f"latest-job:{owner}"
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED_STATES
+
+    def save(self):
+        """Write the current state to the shared store"""
+        with self._lock:
+            state = {"job_id": self.id, "owner": self.owner, "url": self.url, "status": self.status,
+                     "percent": self.percent, "current_track": self.current_track}
+            if self.error: state.update(error=self.error, http_status=self.http_status)
+            if self.status == "done": state["result"] = self.result
+        job_state_store.set(self.state_key(self.id), state)
+
+    def update_progress(self, percent, current_track):
+        with self._lock:
+            if self.finished: return
+            self.status = "running"; self.percent = percent; self.current_track = current_track
+        self.save()
+
+    def _finish(self, status, result=None, error=None, http_status=200):
+        with self._lock:
+            if self.finished: return
+            self.status = status; self.result = result; self.error = error; self.http_status = http_status
+            if status == "done": self.percent = 100
+        self.save()
+        with running_jobs_lock: running_jobs.pop(self.id, None)
+        if status == "done": self.publish("done", {"job_id": self.id, "status": status})
+        else: self.publish(status, {"job_id": self.id, "status": status, "error": error, "http_status": http_status})
+        self.done_event.set()
+
+    @property
+    def streaming(self):
+        return self.events is not None
+
+    def publish(self, event, data):
+        """Hand an event to the stream consumer (no-op for non-streaming jobs)"""
+        if self.events is not None: self.events.put((event, data))
+
+    def complete(self, result): self._finish("done", result=result)
+    def fail(self, error, http_status=500): self._finish("error", error=error, http_status=http_status)
+    def mark_cancelled(self): self._finish("cancelled", error="Analysis cancelled.", http_status=409)
+
+    def request_cancel(self):
+        """Ask the worker to stop; a job that has not started yet is cancelled on the spot"""
+        self.cancel_event.set()
+        if self.status == "queued": self.mark_cancelled()
+
+    def cancel_requested(self):
+        """True once cancellation was asked for here or, through the shared store, from another worker"""
+        if not self.cancel_event.is_set() and job_state_store.get(self.cancel_key(self.id)):
+            self.cancel_event.set()
+        return self.cancel_event.is_set()
+
+running_jobs = {}  # job_id -> AnalysisJob executing in this process (for cancellation and streaming)
+running_jobs_lock = threading.Lock()
+job_executor = ThreadPoolExecutor(max_workers=ANALYSIS_JOB_WORKERS, thread_name_prefix="analysis-job")
+
+def count_jobs(status):
+    with running_jobs_lock: return sum(1 for job in running_jobs.values() if job.status == status)
+
+metrics.register(CallbackGauge("fcc_job_queue_depth", "Analysis jobs waiting for a worker in this process.", lambda: [({}, count_jobs("queued"))]))
+metrics.register(CallbackGauge("fcc_analyses_in_flight", "Analysis jobs running in this process.", lambda: [({}, count_jobs("running"))]))
 
 # --- Helper Functions ---
 
-def cleanup_old_progress_entries():
-    """Remove progress entries older than 1 hour to prevent memory leaks"""
-    now = datetime.now()
-    keys_to_delete = [
-        key for key, timestamp in progress_store_timestamps.items()
-        if now - timestamp > timedelta(hours=1)
-    ]
-    for key in keys_to_delete:
-        progress_store.pop(key, None)
-        progress_store_timestamps.pop(key, None)
-    if keys_to_delete:
-        print(f"Cleaned up {len(keys_to_delete)} old progress entries.", flush=True)
+def get_owned_job_state(job_id, owner):
+    """Look up a job's shared state, hiding jobs that belong to other users"""
+    state = job_state_store.get(AnalysisJob.state_key(job_id)) if job_id else None
+    return state if state and state.get("owner") == owner else None
+
+def public_job_state(state, include_result=True):
+    return {k: v for k, v in state.items() if k not in ("owner", "http_status") and (include_result or k != "result")}
+
+def current_session_key():
+    return session.get("user_id") or session.get("token_info", {}).get("access_token")
 
 def parse_spotify_url(url):
     """Parse Spotify URL using pre-compiled regex"""
@@ -141,180 +263,299 @@ def refresh_token_if_needed():
     expires_at = token_info.get("expires_at", 0)
     if not expires_at or now >= expires_at - 60:
         try:
-            print(f"Refreshing Spotify token (Expires at: {expires_at}, Now: {now})", flush=True)
+            log.info(f"Refreshing Spotify token (Expires at: {expires_at}, Now: {now})")
             token_info = sp_oauth.refresh_access_token(token_info.get("refresh_token"))
             session["token_info"] = token_info
-            print("Token refreshed successfully.", flush=True)
+            log.info("Token refreshed successfully.")
         except Exception as e:
-            print(f"❌ Error refreshing Spotify token: {e}", flush=True)
+            log.error(f"❌ Error refreshing Spotify token: {e}")
             session.clear(); return None
     return token_info
 
-@lru_cache(maxsize=512)
-def clean_track_title(title):
-    """Clean track title using pre-compiled regex patterns (cached for performance)"""
-    title = FEAT_PATTERN.sub("", title)
-    title = FEAT_BRACKET_PATTERN.sub("", title)
-    title = VERSION_PATTERN.sub("", title)
-    title = SUFFIX_PATTERN.sub("", title)
-    title = PART_VOL_PATTERN.sub("", title)
-    title = title.strip(' -')
-    return title.strip()
-
-def get_lyrics_from_lrclib(title, artist, album, duration):
+REUSABLE_STATUSES = ("Explicit", "Clean")  # Lookups that failed are retried rather than reused
+
+def playlist_history_key(playlist_id, fingerprint):
+    return f"playlist-history:{playlist_id}:{fingerprint}"
+
+def split_reusable_tracks(numbered_tracks, previous_results):
     """
-    Fetches lyrics from LRCLIB using connection pooling.
+    Partition (track_number, track_obj) pairs against a playlist's previous results.
 
-    Returns:
-        tuple: (synced_lines, lrclib_url, plain_lyrics)
-               synced_lines: List of (timestamp, text) tuples, or None
-               lrclib_url: URL to the track on LRCLIB, or None
-               plain_lyrics: String of plain lyrics, or None
+    Returns (tracks still to analyze, ready-made results for tracks whose previous
+    result can be reused under their current track number).
     """
-    url = "https://lrclib.net/api/get"
-    params = { "track_name": title, "artist_name": artist, "album_name": album, "duration": int(duration) }
-    headers = {"User-Agent": "FCCSongChecker/1.0 (Backend)"}
-    try:
-        # Use session for connection pooling
-        response = requests_session.get(url, params=params, headers=headers, timeout=10)
-        print(f"LRCLIB request for '{title}' status: {response.status_code}", flush=True)
-        if response.status_code != 200:
-            return None, None, None
-
-        data = response.json()
-        lrclib_url = f"https.lrclib.net/track/{data.get('id')}" if data.get('id') else None
-        synced = data.get("syncedLyrics")
-        plain = data.get("plainLyrics")
-
-        synced_lines = None
-        if synced:
-            # Use pre-compiled regex pattern
-            matches = LRCLIB_TIME_PATTERN.findall(synced)
-            synced_lines = [(int(m) * 60 + float(s), txt.strip()) for m, s, txt in matches if txt.strip()]
-            if synced_lines:
-                print(f"LRCLIB SUCCESS for '{title}' - Found {len(synced_lines)} synced lines.", flush=True)
-            else:
-                 synced_lines = None # Ensure it's None if parsing fails
-                 print(f"LRCLIB found entry for '{title}' but synced lyrics parsing failed or was empty.", flush=True)
+    to_analyze = []; reused = []
+    for idx, track_obj in numbered_tracks:
+        previous = previous_results.get(track_obj.get("id")) if track_obj else None
+        if previous and previous.get("status") in REUSABLE_STATUSES:
+            reused.append({**previous, "track_number": idx, "track_name": track_obj.get("name", previous.get("track_name"))})
         else:
-             print(f"LRCLIB found entry for '{title}' but no synced lyrics field.", flush=True)
+            to_analyze.append((idx, track_obj))
+    return to_analyze, reused
 
-        if plain: print(f"LRCLIB also found plain lyrics for '{title}'.", flush=True)
-        else: print(f"LRCLIB did not find plain lyrics field for '{title}'.", flush=True)
+def finish_job_metrics(result, total_tracks, started):
+    """Record a finished job's throughput, and attach the stage profile when the request asked for one"""
+    elapsed = time.perf_counter() - started
+    if total_tracks and elapsed > 0: job_tracks_per_second.observe(total_tracks / elapsed)
+    profile = active_profile.get()
+    if profile is not None: result["profile"] = profile.summary()
 
-        return synced_lines, lrclib_url, plain
+def run_analysis_job(job, access_token, url_type, item_id, flagged_matcher, fingerprint=None, incremental=True, match_format=None):
+    """
+    Worker body for one analysis job: fetch the Spotify item, analyze its tracks, record the outcome on `job`.
 
+    Playlists are re-analyzed incrementally: results from the previous analysis with the
+    same word selection are reused for tracks still in the playlist, only added tracks
+    hit LRCLIB, and the new result set replaces the stored one.
+    """
+    if job.cancel_requested(): return job.mark_cancelled()
+    job.update_progress(0, "")
+    started = time.perf_counter()
+    try:
+        sp = spotify_client(access_token)
+        try:
+            with timed_stage("fetch_item"):
+                response_data, tracks_to_process = fetch_tracks_for_item(sp, url_type, item_id)
+        except Exception as e:
+            log.error(f"❌ Job {job.id}: Spotify API Error during item fetch: {str(e)}")
+            return job.fail(*spotify_error_fields(e))
+        analysis_results = []; total_tracks = len(tracks_to_process)
+        job.publish("item", {**response_data, "job_id": job.id, "total_tracks": total_tracks})
+        if total_tracks == 0:
+            if url_type == 'track':
+                 log.warning(f"Error: Could not retrieve track data for ID {item_id}.")
+                 return job.fail("Could not retrieve track data. The URL might be invalid or the track unavailable.", 400)
+            response_data["tracks"] = []
+            log.info("Analysis finished: No processable tracks found.")
+            return job.complete(response_data)
+        numbered_tracks = list(enumerate(tracks_to_process, start=1)); reused_results = []
+        # Stored results only carry "matches" in the format they were produced with
+        history_fingerprint = f"{fingerprint}:{match_format}" if match_format else fingerprint
+        history_key = playlist_history_key(item_id, history_fingerprint) if url_type == 'playlist' and incremental and fingerprint else None
+        previous = playlist_history_store.get(history_key) if history_key else None
+        if previous:
+            numbered_tracks, reused_results = split_reusable_tracks(numbered_tracks, previous["results"])
+            log.info(f"Incremental re-analysis of playlist {item_id} (snapshot {previous.get('snapshot_id')} -> {response_data.get('snapshot_id')}): "
+                  f"reusing {len(reused_results)} results, analyzing {len(numbered_tracks)} tracks.")
+        track_ids = {idx: track_obj.get("id") for idx, track_obj in enumerate(tracks_to_process, start=1) if track_obj}
+        history_results = {}
+        # LRCLIB lookups overlap in a bounded pool; progress counts completed tracks
+        track_results = iter_track_analyses(numbered_tracks, flagged_matcher, match_format=match_format)
+        try:
+            for completed, result in enumerate(itertools.chain(reused_results, track_results), start=1):
+                if job.cancel_requested():
+                    log.info(f"Job {job.id} cancelled after {completed - 1}/{total_tracks} tracks.")
+                    return job.mark_cancelled()
+                percent = int((completed / total_tracks) * 100)
+                job.update_progress(percent, result["track_name"])
+                if history_key and track_ids.get(result["track_number"]): history_results[track_ids[result["track_number"]]] = result
+                # Streamed results go straight to the client instead of accumulating here
+                if job.streaming: job.publish("track", {"percent": percent, "completed": completed, "track": result})
+                else: analysis_results.append(result)
+        finally:
+            track_results.close()
+        if history_key:
+            playlist_history_store.set(history_key, {"snapshot_id": response_data.get("snapshot_id"), "results": history_results})
+        if job.streaming:
+            response_data["total_tracks"] = total_tracks
+        else:
+            analysis_results.sort(key=lambda r: r["track_number"])
+            response_data["tracks"] = analysis_results
+        finish_job_metrics(response_data, total_tracks, started)
+        log.info(f"Job {job.id}: analysis finished successfully.")
+        job.complete(response_data)
     except Exception as e:
-        print(f"⚠️ LRCLIB fetch EXCEPTION for '{title}': {e}", flush=True)
-        return None, None, None
-
-# --- REMOVED: get_lyrics_from_genius function ---
-
-# --- MODIFIED: analyze_track_lyrics NO Genius fallback ---
-def analyze_track_lyrics(track_obj, track_number, flagged_words):
-    """Optimized track lyrics analysis with efficient word matching"""
-    if not track_obj:
-        return {"track_number": track_number, "track_name": "Track not available", "status": "Error", "flagged_words": [], "lrclib_url": None}
-
-    track_name = track_obj.get("name", "Unknown Track")
-    main_artist = track_obj.get("artists", [{}])[0].get("name", "Unknown Artist")
-    album_name = track_obj.get("album", {}).get("name", "")
-    duration = track_obj.get("duration_ms", 0) / 1000
-    title_clean_search = clean_track_title(track_name)
-    print(f"--- Analyzing Track {track_number}: '{track_name}' by '{main_artist}' (Cleaned: '{title_clean_search}') ---", flush=True)
-    print(f"DEBUG: Starting lyric search for '{track_name}'", flush=True)
-
-    # --- Try LRCLIB ---
-    lrclib_lines, lrclib_url, plain_lyrics = get_lyrics_from_lrclib(title_clean_search, main_artist, album_name, duration)
-
-    # Pre-compute sets for efficient lookups
-    flagged_set = set(flagged_words) if not isinstance(flagged_words, set) else flagged_words
-    phrases = {w for w in flagged_set if ' ' in w}
-    single_words = flagged_set - phrases
-
-    # --- 1. Process LRCLIB Synced Lyrics (Highest Priority) ---
-    if lrclib_lines is not None and len(lrclib_lines) > 0:
-        print(f"Processing LRCLIB SYNCED results for '{track_name}'.", flush=True)
-        flagged_entries = []
-
-        for time_sec, line_text in lrclib_lines:
-            line_lower = line_text.lower()
-            phrases_found_in_line = set()
-
-            # Check phrases first (more specific)
-            for phrase in phrases:
-                if phrase in line_lower:
-                    flagged_entries.append({"timestamp": round(time_sec, 3), "context": phrase})
-                    phrases_found_in_line.add(phrase)
-
-            # Check single words (skip if part of found phrase)
-            if single_words:
-                words_in_line = WORD_BOUNDARY_PATTERN.findall(line_lower)
-                phrase_words = {word for phrase in phrases_found_in_line for word in phrase.split()}
-
-                for word in words_in_line:
-                    if word in single_words and word not in phrase_words:
-                        flagged_entries.append({"timestamp": round(time_sec, 3), "context": word})
-
-        # Remove duplicates efficiently
-        unique_flagged = [dict(t) for t in {tuple(sorted(d.items())) for d in flagged_entries}]
-        status = "Explicit" if unique_flagged else "Clean"
-        print(f"LRCLIB SYNCED Result for '{track_name}': Status={status}, Found={len(unique_flagged)}.", flush=True)
-        return {"track_number": track_number, "track_name": track_name, "status": status,
-                 "flagged_words": unique_flagged, "lrclib_url": lrclib_url}
-
-    # --- 2. Process LRCLIB Plain Lyrics (If Synced Failed/Empty) ---
-    elif plain_lyrics is not None and plain_lyrics.strip():
-        print(f"Processing LRCLIB PLAIN results for '{track_name}'.", flush=True)
-        lyrics_lower = plain_lyrics.lower()
-
-        # Optimized word search using set comprehension
-        found_words = []
-        for word in flagged_set:
-            # Use simple string search for phrases, word boundary for single words
-            if ' ' in word:
-                if word in lyrics_lower:
-                    found_words.append(word)
-            else:
-                # More efficient than regex for each word
-                pattern = f"\\b{re.escape(word)}\\b"
-                if re.search(pattern, lyrics_lower):
-                    found_words.append(word)
-
-        status = "Explicit" if found_words else "Clean"
-        simple_found = list(set(found_words))
-        print(f"LRCLIB PLAIN Result for '{track_name}': Status={status}, Found={len(simple_found)}.", flush=True)
-        return {"track_number": track_number, "track_name": track_name, "status": status,
-                 "flagged_words": simple_found, "lrclib_url": lrclib_url}
-
-    # --- 3. Report Not Found (If ALL LRCLIB options failed/empty) ---
-    else:
-        print(f"LRCLIB failed (no synced or plain lyrics) for '{track_name}'. Reporting 'Lyrics Not Found'.", flush=True)
-        return {"track_number": track_number, "track_name": track_name, "status": "Lyrics Not Found",
-                 "flagged_words": [], "lrclib_url": lrclib_url}
-# --- End modification ---
+        log.exception(f"❌❌❌ UNEXPECTED Error in analysis job {job.id}: {e}")
+        job.fail(f"Unexpected error during analysis: {str(e)}", 500)
 
+def spotify_error_fields(e):
+    """Error message and HTTP status for a failed Spotify item fetch"""
+    if isinstance(e, spotipy.exceptions.SpotifyException): return f"Spotify API error ({e.http_status}): {e.msg}", e.http_status or 500
+    return f"Spotify API error: {str(e)}", 500
+
+def run_batch_analysis_job(job, access_token, items, flagged_matcher, match_format=None):
+    """
+    Worker body for a batch job: resolve every (url, url_type, item_id), then analyze all of their tracks in one pass.
+
+    Track and album links are resolved to IDs first so their full track objects come from
+    shared 50-ID `sp.tracks` calls across items. A track listed by several items is
+    analyzed once and its result copied into each item, numbered by its position there.
+    An item that cannot be fetched gets its own error without failing the batch.
+    """
+    if job.cancel_requested(): return job.mark_cancelled()
+    job.update_progress(0, "")
+    started = time.perf_counter()
+    try:
+        sp = spotify_client(access_token)
+        entries = []; wanted_ids = []
+        for url, url_type, item_id in items:
+            entry = {"url": url, "type": url_type}
+            try:
+                with timed_stage("fetch_item"):
+                    if url_type == 'track': entry["track_ids"] = [item_id]
+                    elif url_type == 'album':
+                        header, entry["track_ids"] = fetch_album_header(sp, item_id); entry.update(header)
+                    else:
+                        header, entry["tracks"] = fetch_tracks_for_item(sp, url_type, item_id); entry.update(header)
+            except Exception as e:
+                log.error(f"❌ Job {job.id}: Spotify API Error fetching {url}: {str(e)}")
+                entry["error"], entry["http_status"] = spotify_error_fields(e)
+            entries.append(entry); wanted_ids.extend(entry.get("track_ids", []))
+            if job.cancel_requested(): return job.mark_cancelled()
+        with timed_stage("fetch_tracks"):
+            full_tracks = {track["id"]: track for track in fetch_full_tracks(sp, list(dict.fromkeys(wanted_ids)))}
+        unique_tracks = OrderedDict()
+        for entry in entries:
+            if "track_ids" in entry:
+                entry["tracks"] = [full_tracks[track_id] for track_id in entry.pop("track_ids") if track_id in full_tracks]
+                if entry["type"] == 'track':
+                    if entry["tracks"]: entry.update(track_item_header(entry["tracks"][0]))
+                    else: entry.update(error="Could not retrieve track data. The URL might be invalid or the track unavailable.", http_status=400); del entry["tracks"]
+            for track_obj in entry.get("tracks", []):
+                if track_obj and track_obj.get("id"): unique_tracks.setdefault(track_obj["id"], track_obj)
+        numbered_tracks = list(enumerate(unique_tracks.values(), start=1)); total_tracks = len(numbered_tracks)
+        log.info(f"Batch job {job.id}: {len(entries)} items, {total_tracks} unique tracks.")
+        results_by_id = {}
+        track_results = iter_track_analyses(numbered_tracks, flagged_matcher, match_format=match_format)
+        try:
+            for completed, result in enumerate(track_results, start=1):
+                if job.cancel_requested():
+                    log.info(f"Job {job.id} cancelled after {completed - 1}/{total_tracks} tracks.")
+                    return job.mark_cancelled()
+                job.update_progress(int((completed / total_tracks) * 100), result["track_name"])
+                results_by_id[numbered_tracks[result["track_number"] - 1][1]["id"]] = result
+        finally:
+            track_results.close()
+        for entry in entries:
+            if "tracks" not in entry: continue
+            entry["tracks"] = [{**results_by_id[track_obj["id"]], "track_number": idx, "track_name": track_obj.get("name", results_by_id[track_obj["id"]]["track_name"])}
+                               if track_obj and track_obj.get("id") in results_by_id else
+                               {"track_number": idx, "track_name": "Track Data Unavailable", "status": "Error", "flagged_words": [], "lrclib_url": None}
+                               for idx, track_obj in enumerate(entry["tracks"], start=1)]
+        result = {"type": "batch", "items": entries, "unique_tracks": total_tracks}
+        finish_job_metrics(result, total_tracks, started)
+        log.info(f"Job {job.id}: batch analysis finished successfully.")
+        job.complete(result)
+    except Exception as e:
+        log.exception(f"❌❌❌ UNEXPECTED Error in batch job {job.id}: {e}")
+        job.fail(f"Unexpected error during analysis: {str(e)}", 500)
 
 # --- Flask Routes ---
 # (Keep all the existing route code: /, /login, /callback, /logout, /me, /search, /progress, /analyze)
 # ...
 
+# --- Static frontend: the React build, indexed once and served with precompressed variants ---
+BUILD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build")
+COMPRESSIBLE_EXTENSIONS = {".html", ".js", ".css", ".json", ".map", ".txt", ".svg", ".ico"}
+STATIC_COMPRESS_MIN_BYTES = 1024
+HASHED_ASSET_PATTERN = re.compile(r"\.[0-9a-f]{8,}\.")  # CRA names bundles main.<hash>.js, so their content never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CONTENT_CODINGS = (("br", ".br"), ("gzip", ".gz"))  # Preference order
+
+class StaticAsset:
+    __slots__ = ("path", "mimetype", "etag", "cache_control", "variants")
+
+    def __init__(self, path, mimetype, etag, cache_control, variants):
+        self.path = path; self.mimetype = mimetype; self.etag = etag
+        self.cache_control = cache_control; self.variants = variants  # content coding -> file path
+
+class StaticAssetIndex:
+    """
+    The build tree, walked once when the app loads: per file its media type, content ETag,
+    cache policy and precompressed siblings (`<file>.br` when the brotli package is
+    installed, `<file>.gz`).
+
+    Missing or outdated variants are written next to the originals while indexing (ideally
+    at deploy time with `flask compress-static`, so workers only find them), and requests
+    just pick a file and hand it to the server's sendfile. Hashed bundles are cached as
+    immutable; index.html and other unhashed files are revalidated with their ETag.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._assets = self.build()
+
+    @staticmethod
+    def _write_variant(source_path, variant_path, compress):
+        try:
+            st = os.stat(variant_path)
+            if st.st_mtime_ns >= os.stat(source_path).st_mtime_ns: return variant_path
+        except OSError:
+            pass
+        with open(source_path, "rb") as f: data = f.read()
+        compressed = compress(data)
+        if len(compressed) >= len(data): return None
+        tmp_path = f"{variant_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f: f.write(compressed)
+            os.replace(tmp_path, variant_path)
+        except OSError as e:
+            log.warning(f"⚠️ Could not write {variant_path}: {e}"); return None
+        return variant_path
+
+    def _index_file(self, rel_path, full_path):
+        with open(full_path, "rb") as f: etag = hashlib.sha256(f.read()).hexdigest()[:20]
+        mimetype = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        hashed = rel_path.startswith("static/") and HASHED_ASSET_PATTERN.search(os.path.basename(rel_path))
+        variants = {}
+        if os.path.splitext(full_path)[1] in COMPRESSIBLE_EXTENSIONS and os.path.getsize(full_path) >= STATIC_COMPRESS_MIN_BYTES:
+            compressors = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None: compressors["br"] = lambda data: brotli.compress(data, quality=11)
+            for coding, suffix in CONTENT_CODINGS:
+                if coding not in compressors: continue
+                variant_path = self._write_variant(full_path, full_path + suffix, compressors[coding])
+                if variant_path: variants[coding] = variant_path
+        return StaticAsset(full_path, mimetype, etag, IMMUTABLE_CACHE_CONTROL if hashed else "no-cache", variants)
+
+    def build(self):
+        assets = {}
+        if not os.path.isdir(self.root):
+            log.warning(f"WARNING: '{self.root}' folder not found. Frontend may not be served.")
+            return assets
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith((".gz", ".br", ".tmp")): continue
+                full_path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                try: assets[rel_path] = self._index_file(rel_path, full_path)
+                except OSError as e: log.warning(f"⚠️ Skipping unreadable static file {full_path}: {e}")
+        log.info(f"Indexed {len(assets)} frontend files ({sum(len(a.variants) for a in assets.values())} compressed variants).")
+        return assets
+
+    def get(self, rel_path):
+        return self._assets.get(rel_path)
+
+static_assets = StaticAssetIndex(BUILD_FOLDER)  # Indexed at import, so no request pays for hashing or compressing the build
+
+def static_asset_response(asset):
+    """The smallest variant the client accepts, with caching headers; 304 when its ETag still matches"""
+    coding = next((coding for coding, _ in CONTENT_CODINGS if coding in asset.variants and coding in request.accept_encodings), None)
+    etag = f"{asset.etag}-{coding}" if coding else asset.etag
+    headers = {"ETag": f'"{etag}"', "Cache-Control": asset.cache_control}
+    if asset.variants: headers["Vary"] = "Accept-Encoding"
+    if etag in request.if_none_match: return Response(status=304, headers=headers)
+    # send_file goes through the server's wsgi.file_wrapper, i.e. sendfile under gunicorn
+    response = send_file(asset.variants[coding] if coding else asset.path, mimetype=asset.mimetype, conditional=False, etag=False,
+                         download_name=os.path.basename(asset.path))
+    if coding: headers["Content-Encoding"] = coding
+    response.headers.update(headers)
+    return response
+
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def serve(path):
-    build_path = os.path.join(os.path.dirname(__file__), "build")
-    if not os.path.exists(build_path):
-        return "Build folder not found. Make sure the React app is built and placed correctly.", 500
-    if path != "" and os.path.exists(os.path.join(build_path, path)):
-        return send_from_directory(build_path, path)
-    elif os.path.exists(os.path.join(build_path, "index.html")):
-        return send_from_directory(build_path, "index.html")
-    else: return "index.html not found in build folder.", 404
+    asset = static_assets.get(path) if path else None
+    # Client-side routes get the app shell; a missing bundle is a real 404
+    if asset is None and not path.startswith("static/"): asset = static_assets.get("index.html")
+    if asset is None:
+        if path.startswith("static/"): return "Not found.", 404
+        return "index.html not found in build folder.", 404
+    return static_asset_response(asset)
 
 @app.route("/login")
 def login():
     auth_url = sp_oauth.get_authorize_url()
-    print(f"Redirecting user to Spotify login: {auth_url}", flush=True)
+    log.info(f"Redirecting user to Spotify login: {auth_url}")
     return redirect(auth_url)
 
 @app.route("/callback")
@@ -322,65 +563,94 @@ def callback():
     try:
         code = request.args.get("code")
         if not code: return "Error: No authorization code received from Spotify.", 400
-        print("Received callback code from Spotify.", flush=True)
+        log.info("Received callback code from Spotify.")
         token_info = sp_oauth.get_access_token(code, as_dict=True)
         session["token_info"] = token_info
-        print("Spotify token obtained and stored in session.", flush=True)
+        log.info("Spotify token obtained and stored in session.")
         frontend_url = os.getenv('FRONTEND_URL', 'http://127.0.0.1:5000')
         redirect_url = f"{frontend_url}?logged_in=true"
-        print(f"Redirecting back to frontend: {redirect_url}", flush=True)
+        log.info(f"Redirecting back to frontend: {redirect_url}")
         return redirect(redirect_url)
     except Exception as e:
-        print(f"❌ Error during Spotify callback: {e}", flush=True)
+        log.error(f"❌ Error during Spotify callback: {e}")
         return f"Error during Spotify login callback: {str(e)}", 500
 
 @app.route("/logout")
 def logout():
     session.clear()
-    print("User session cleared (logout).", flush=True)
+    log.info("User session cleared (logout).")
     return jsonify({"logged_out": True})
 
 @app.route("/me")
 def me():
     token_info = refresh_token_if_needed()
     if not token_info:
-        print("GET /me: No valid token, user not logged in.", flush=True)
+        log.info("GET /me: No valid token, user not logged in.")
         return jsonify({"logged_in": False}), 401
     try:
-        sp = spotipy.Spotify(auth=token_info["access_token"])
+        sp = spotify_client(token_info["access_token"])
         user_profile = sp.current_user()
         user_id = user_profile.get("id")
         if user_id: session["user_id"] = user_id
-        print(f"GET /me: User '{user_profile.get('display_name')}' logged in (ID: {user_id}).", flush=True)
+        log.info(f"GET /me: User '{user_profile.get('display_name')}' logged in (ID: {user_id}).")
 
-        # Convert sets to lists for JSON serialization
-        word_lists_for_frontend = {lang: list(words) for lang, words in DEFAULT_WORD_LISTS.items()}
-
-        return jsonify({
-            "logged_in": True, "id": user_id,
-            "name": user_profile.get("display_name", "Unknown"),
-            "default_word_lists": word_lists_for_frontend
-        })
+        # The bundled frontend still reads the full lists from default_word_lists, which come pre-encoded
+        # (and pre-compressed); newer clients fetch them from the cacheable /wordlists/<lang> instead
+        return me_response({"logged_in": True, "id": user_id, "name": user_profile.get("display_name", "Unknown")},
+                           "gzip" in request.accept_encodings)
     except Exception as e:
-        print(f"❌ Error fetching user profile from Spotify: {e}", flush=True)
+        log.error(f"❌ Error fetching user profile from Spotify: {e}")
         if isinstance(e, spotipy.exceptions.SpotifyException) and e.http_status in [401, 403]:
-             print("Spotify token invalid or expired, clearing session.", flush=True)
+             log.info("Spotify token invalid or expired, clearing session.")
              session.clear(); return jsonify({"logged_in": False, "error": "Spotify token invalid, session cleared."}), 401
         return jsonify({"logged_in": False, "error": f"Failed to fetch Spotify profile: {str(e)}"}), 500
 
+@app.route("/wordlists")
+def word_list_manifest():
+    """Versions and URLs of the default word lists"""
+    payloads = get_word_list_payloads()
+    response = jsonify(payloads["manifest"])
+    response.set_etag(payloads["version"])
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+@app.route("/wordlists/<lang_code>")
+def word_list(lang_code):
+    """
+    One default word list as precomputed (optionally gzipped) JSON.
+
+    Answers 304 when If-None-Match carries the current ETag. Requests for the URL in the
+    manifest (`?v=<version>`) are cacheable forever, since a changed list gets a new version.
+    """
+    payload = get_word_list_payloads()["lists"].get(lang_code)
+    if not payload: return jsonify({"error": f"Unknown word list '{lang_code}'."}), 404
+    etag = payload["etag"]
+    use_gzip = "gzip" in request.accept_encodings
+    headers = {
+        "ETag": f'"{etag}-gz"' if use_gzip else f'"{etag}"',
+        "Cache-Control": "public, max-age=31536000, immutable" if request.args.get("v") == etag else "public, no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(f"{etag}-gz"):
+        return Response(status=304, headers=headers)
+    body = payload["gzip"] if use_gzip else payload["body"]
+    if use_gzip: headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
 @app.route("/search", methods=["POST"])
 def search():
     token_info = refresh_token_if_needed()
     if not token_info: return jsonify({"error": "User not logged in."}), 401
     data = request.get_json(); query = data.get("query")
     if not query: return jsonify({"error": "No query provided."}), 400
-    print(f"POST /search: Query='{query}'", flush=True)
-    sp = spotipy.Spotify(auth=token_info["access_token"])
+    log.info(f"POST /search: Query='{query}'")
+    sp = spotify_client(token_info["access_token"])
     try:
-        results = sp.search(q=query, type='track,album', limit=5, market='US')
+        results = spotify_cached(f"search:{query.strip().lower()}", SPOTIFY_SEARCH_TTL,
+                                 lambda: sp.search(q=query, type='track,album', limit=5, market='US'))
         formatted_results = []
         if results.get('tracks'):
-            print(f"Found {len(results['tracks']['items'])} tracks.", flush=True)
+            log.info(f"Found {len(results['tracks']['items'])} tracks.")
             for item in results['tracks']['items']:
                 if not item or not item.get('artists'): continue
                 formatted_results.append({
@@ -389,7 +659,7 @@ def search():
                     "url": item['external_urls']['spotify']
                 })
         if results.get('albums'):
-            print(f"Found {len(results['albums']['items'])} albums.", flush=True)
+            log.info(f"Found {len(results['albums']['items'])} albums.")
             for item in results['albums']['items']:
                 if not item or not item.get('artists'): continue
                 formatted_results.append({
@@ -397,10 +667,10 @@ def search():
                     "cover": item['images'][-1]['url'] if item.get('images') and item['images'] else None,
                     "url": item['external_urls']['spotify']
                 })
-        print(f"Returning {len(formatted_results)} search results.", flush=True)
+        log.info(f"Returning {len(formatted_results)} search results.")
         return jsonify(formatted_results[:10])
     except Exception as e:
-        print(f"❌ POST /search: Spotify API Error: {str(e)}", flush=True)
+        log.error(f"❌ POST /search: Spotify API Error: {str(e)}")
         error_message = f"Spotify API error during search: {str(e)}"
         if isinstance(e, spotipy.exceptions.SpotifyException):
              error_message = f"Spotify API error ({e.http_status}) during search: {e.msg}"; return jsonify({"error": error_message}), e.http_status or 500
@@ -408,140 +678,193 @@ def search():
 
 @app.route("/progress")
 def progress():
-    session_key = session.get("user_id") or session.get("token_info", {}).get("access_token")
+    """Legacy progress poll: reports the caller's most recent job"""
+    session_key = current_session_key()
     if not session_key: return jsonify({"percent": 0, "current_track": ""})
-    return jsonify(progress_store.get(session_key, {"percent": 0, "current_track": ""}))
+    state = get_owned_job_state(job_state_store.get(AnalysisJob.owner_key(session_key)), session_key)
+    if not state: return jsonify({"percent": 0, "current_track": ""})
+    return jsonify({"job_id": state["job_id"], "percent": state["percent"], "current_track": state["current_track"]})
+
+def wants_async_response(data):
+    return bool(data.get("async")) or "respond-async" in request.headers.get("Prefer", "")
+
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_MIMETYPES = ("text/event-stream", "application/x-ndjson")
+
+def requested_stream_mimetype():
+    """Streaming mode is chosen by Accept; plain JSON stays the default for */* clients"""
+    best = request.accept_mimetypes.best_match(("application/json",) + STREAM_MIMETYPES)
+    return best if best in STREAM_MIMETYPES else None
+
+def stream_job_events(job, mimetype):
+    """Forward a streaming job's events as SSE or NDJSON until the job finishes; a dropped client cancels the job"""
+    def encode(event, data):
+        if mimetype == "text/event-stream": return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"event": event, "data": data}) + "\n"
+    try:
+        while True:
+            try:
+                event, data = job.events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n" if mimetype == "text/event-stream" else encode("ping", {"job_id": job.id})
+                continue
+            yield encode(event, data)
+            if event in AnalysisJob.FINISHED_STATES: break
+    finally:
+        if not job.finished:
+            log.info(f"Stream for job {job.id} closed early, cancelling.")
+            job.request_cancel()
+
+def finished_job_response(job, profile=None):
+    """Wait for `job` and answer with its result (or error), adding Server-Timing for a profiled request"""
+    job.done_event.wait()
+    if job.status != "done":
+        response = jsonify({"job_id": job.id, "error": job.error}); response.status_code = job.http_status
+    else:
+        response = jsonify({**job.result, "job_id": job.id})
+    if profile is not None: response.headers["Server-Timing"] = profile.server_timing()
+    return response
 
 @app.route("/analyze", methods=["POST"])
 def analyze():
-    # Clean up old progress entries to prevent memory leaks
-    cleanup_old_progress_entries()
-
+    """
+    Enqueue an analysis job.
+
+    Clients that send `Prefer: respond-async` (or `"async": true`) get 202 with the
+    job ID right away and fetch the outcome from /jobs/<job_id>. Clients that accept
+    `text/event-stream` or `application/x-ndjson` get each track result pushed as soon
+    as it is ready. Other clients (the bundled frontend) wait for the job and receive
+    the full result as before.
+    Any mode can send `X-Profile: 1` to get per-stage timings back (Server-Timing
+    header when waiting, `profile` in the job result).
+    """
     token_info = refresh_token_if_needed()
     if not token_info: return jsonify({"error": "User not logged in. Please log in again."}), 401
     data = request.get_json(); url = data.get("url")
     custom_words_str = data.get("custom_words", ""); selected_defaults = data.get("selected_defaults", [])
     if not url: return jsonify({"error": "No URL provided."}), 400
-    print(f"\n--- POST /analyze: URL='{url}' ---", flush=True)
-    user_id = session.get("user_id"); session_key = user_id or token_info["access_token"]
-
-    # Initialize progress with timestamp
-    progress_store[session_key] = {"percent": 0, "current_track": ""}
-    progress_store_timestamps[session_key] = datetime.now()
-
-    # Build flagged words set (keep as set for performance)
-    flagged_words_to_use = set()
-    if custom_words_str.strip():
-        print("Using custom word list provided by user.", flush=True)
-        processed_str = custom_words_str.replace(",", "\n")
-        custom_list = {line.strip().lower() for line in processed_str.splitlines() if line.strip()}
-        flagged_words_to_use.update(custom_list)
-    else:
-        print(f"Using selected default lists: {selected_defaults}", flush=True)
-        for lang_code in selected_defaults:
-            if lang_code in DEFAULT_WORD_LISTS:
-                flagged_words_to_use.update(DEFAULT_WORD_LISTS[lang_code])
-            else:
-                print(f"Warning: Requested default list '{lang_code}' not found/loaded on backend.", flush=True)
-
-    if not flagged_words_to_use:
-        print("Error: No flagged words selected or provided.", flush=True)
-        progress_store.pop(session_key, None)
-        progress_store_timestamps.pop(session_key, None)
+    log.info(f"--- POST /analyze: URL='{url}' ---")
+    session_key = current_session_key() or token_info["access_token"]
+
+    flagged_matcher, fingerprint = get_flagged_matcher(custom_words_str, selected_defaults)
+    if not flagged_matcher:
+        log.warning("Error: No flagged words selected or provided.")
         return jsonify({"error": "No flagged words selected or provided."}), 400
-    print(f"Analyzing with {len(flagged_words_to_use)} unique words.", flush=True)
+    log.info(f"Analyzing with {len(flagged_matcher)} unique words.")
     url_type, item_id = parse_spotify_url(url)
     if not url_type or not item_id:
-         print(f"Error: Invalid Spotify URL format: {url}", flush=True)
-         progress_store.pop(session_key, None)
-         progress_store_timestamps.pop(session_key, None)
+         log.warning(f"Error: Invalid Spotify URL format: {url}")
          return jsonify({"error": "Invalid or unsupported Spotify URL format."}), 400
-    sp = spotipy.Spotify(auth=token_info["access_token"])
-    tracks_to_process = []; response_data = {"type": url_type}
-    try:
-        print(f"Fetching '{url_type}' with ID: {item_id} from Spotify...", flush=True)
-        if url_type == 'track':
-            track_info = sp.track(item_id); tracks_to_process = [track_info] if track_info else []
-            if tracks_to_process and track_info.get("album"): response_data.update({"name": track_info["album"]["name"], "artist": track_info["artists"][0]["name"], "album_cover": track_info["album"]["images"][0]["url"] if track_info["album"]["images"] else None})
-            elif tracks_to_process: response_data.update({"name": track_info["name"], "artist": track_info["artists"][0]["name"], "album_cover": None})
-        elif url_type == 'album':
-            album_info = sp.album(item_id);
-            if not album_info: raise Exception(f"Album ID {item_id} not found or unavailable.")
-            album_tracks_results = sp.album_tracks(item_id, limit=50)
-            album_track_ids = [t['id'] for t in album_tracks_results['items'] if t and t.get('id')]
-            offset = 0; full_track_objects = []
-            while offset < len(album_track_ids):
-                 batch_ids = album_track_ids[offset:offset+50]; offset += 50
-                 if not batch_ids: break
-                 try: batch_tracks = sp.tracks(batch_ids); full_track_objects.extend(t for t in batch_tracks['tracks'] if t)
-                 except spotipy.exceptions.SpotifyException as batch_error: print(f"Warning: Error fetching batch of album tracks: {batch_error}", flush=True)
-            tracks_to_process = full_track_objects
-            response_data.update({"name": album_info["name"], "artist": album_info["artists"][0]["name"], "album_cover": album_info["images"][0]["url"] if album_info["images"] else None})
-        elif url_type == 'playlist':
-            playlist_info = sp.playlist(item_id, fields='name,owner.display_name,images,tracks.total');
-            if not playlist_info: raise Exception(f"Playlist ID {item_id} not found or unavailable.")
-            response_data.update({"name": playlist_info["name"], "owner": playlist_info["owner"]["display_name"], "cover": playlist_info["images"][0]["url"] if playlist_info["images"] else None})
-            items = []; offset = 0; limit = 100
-            while True:
-                try:
-                    results = sp.playlist_items(item_id, fields='items(is_local,track(id,name,artists,album(name,images),duration_ms,external_urls)),next,offset,total', limit=limit, offset=offset)
-                    current_items = results.get('items', [])
-                    items.extend(item for item in current_items if item and not item.get('is_local') and item.get('track'))
-                    if results.get('next') is None or len(current_items) == 0: break
-                    offset += len(current_items)
-                except spotipy.exceptions.SpotifyException as page_error: print(f"Warning: Error fetching playlist page (offset {offset}): {page_error}", flush=True); break
-                time.sleep(0.05)
-            tracks_to_process = [item["track"] for item in items]
-        print(f"Found {len(tracks_to_process)} tracks to process.", flush=True)
-    except Exception as e:
-        print(f"❌ POST /analyze: Spotify API Error during item fetch: {str(e)}", flush=True)
-        progress_store.pop(session_key, None)
-        progress_store_timestamps.pop(session_key, None)
-        if isinstance(e, spotipy.exceptions.SpotifyException): return jsonify({"error": f"Spotify API error ({e.http_status}): {e.msg}"}), e.http_status or 500
-        return jsonify({"error": f"Spotify API error: {str(e)}"}), 500
-    analysis_results = []; total_tracks = len(tracks_to_process)
-    if total_tracks == 0:
-        if url_type == 'track':
-             print(f"Error: Could not retrieve track data for ID {item_id}.", flush=True)
-             progress_store.pop(session_key, None)
-             progress_store_timestamps.pop(session_key, None)
-             return jsonify({"error": "Could not retrieve track data. The URL might be invalid or the track unavailable."}), 400
-        response_data["tracks"] = []
-        progress_store.pop(session_key, None)
-        progress_store_timestamps.pop(session_key, None)
-        print("Analysis finished: No processable tracks found.", flush=True)
-        return jsonify(response_data)
-    for idx, track_obj in enumerate(tracks_to_process, start=1):
-        if not track_obj or not track_obj.get('id') or not track_obj.get('name'):
-            print(f"Warning: Skipping invalid/incomplete track object at index {idx-1}", flush=True)
-             # REMOVED genius_url
-            analysis_results.append({"track_number": idx, "track_name": "Track Data Unavailable", "status": "Error", "flagged_words": [], "lrclib_url": None}); continue
-        if 'album' not in track_obj or track_obj['album'] is None: track_obj['album'] = {'name': '', 'images': []}
-        if 'artists' not in track_obj or not track_obj['artists']: track_obj['artists'] = [{'name': 'Unknown Artist'}]
-        current_track_name = track_obj.get("name", f"Track {idx}")
-        progress_store[session_key] = {"percent": int((idx / total_tracks) * 100), "current_track": current_track_name}
-        try:
-            # Pass set for optimal performance
-            result = analyze_track_lyrics(track_obj, idx, flagged_words_to_use)
-            analysis_results.append(result)
-        except Exception as track_error:
-             import traceback
-             print(f"❌❌❌ UNEXPECTED Error analyzing track '{current_track_name}' (Index {idx-1}): {track_error}\n{traceback.format_exc()}", flush=True)
-             analysis_results.append({"track_number": idx, "track_name": current_track_name, "status": "Analysis Error", "flagged_words": [], "lrclib_url": None})
-        time.sleep(0.05)
-    response_data["tracks"] = analysis_results
-
-    # Clean up progress tracking
-    progress_store.pop(session_key, None)
-    progress_store_timestamps.pop(session_key, None)
-
-    print("Analysis finished successfully.", flush=True)
-    return jsonify(response_data)
+    match_format = data.get("matches")
+    if match_format not in (None,) + MATCH_FORMATS: return jsonify({"error": f"'matches' must be one of {', '.join(MATCH_FORMATS)}."}), 400
+
+    stream_mimetype = requested_stream_mimetype()
+    job = AnalysisJob(session_key, url, stream=bool(stream_mimetype))
+    with running_jobs_lock: running_jobs[job.id] = job
+    job.save()
+    job_state_store.set(AnalysisJob.owner_key(session_key), job.id)
+    profile = start_request_profile()
+    job_executor.submit(profiled_context(profile).run, run_analysis_job, job, token_info["access_token"], url_type, item_id,
+                        flagged_matcher, fingerprint, data.get("incremental", True) is not False, match_format)
+    log.info(f"Queued analysis job {job.id}.")
+
+    if stream_mimetype:
+        return Response(stream_job_events(job, stream_mimetype), mimetype=stream_mimetype,
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Job-Id": job.id})
+    if wants_async_response(data):
+        return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}), 202
+    return finished_job_response(job, profile)
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """
+    Enqueue one job that analyzes many Spotify links against a single word selection.
 
+    Takes `urls` plus the same word fields as /analyze. Answers 202 with the job ID
+    when asked to (as /analyze does), otherwise waits and returns every item's
+    results grouped in request order.
+    """
+    token_info = refresh_token_if_needed()
+    if not token_info: return jsonify({"error": "User not logged in. Please log in again."}), 401
+    data = request.get_json(); urls = data.get("urls")
+    custom_words_str = data.get("custom_words", ""); selected_defaults = data.get("selected_defaults", [])
+    if not isinstance(urls, list) or not urls: return jsonify({"error": "No URLs provided."}), 400
+    match_format = data.get("matches")
+    if match_format not in (None,) + MATCH_FORMATS: return jsonify({"error": f"'matches' must be one of {', '.join(MATCH_FORMATS)}."}), 400
+    if len(urls) > BATCH_MAX_URLS: return jsonify({"error": f"Too many URLs (at most {BATCH_MAX_URLS} per batch)."}), 400
+    log.info(f"--- POST /analyze/batch: {len(urls)} URLs ---")
+    session_key = current_session_key() or token_info["access_token"]
+
+    flagged_matcher, _ = get_flagged_matcher(custom_words_str, selected_defaults)
+    if not flagged_matcher:
+        log.warning("Error: No flagged words selected or provided.")
+        return jsonify({"error": "No flagged words selected or provided."}), 400
+    items = []; invalid = []
+    for url in dict.fromkeys(str(url).strip() for url in urls):
+        url_type, item_id = parse_spotify_url(url)
+        if url_type and item_id: items.append((url, url_type, item_id))
+        else: invalid.append(url)
+    if invalid:
+        log.warning(f"Error: Invalid Spotify URL format in batch: {invalid}")
+        return jsonify({"error": "Invalid or unsupported Spotify URL format.", "invalid_urls": invalid}), 400
+
+    job = AnalysisJob(session_key, [url for url, _, _ in items])
+    with running_jobs_lock: running_jobs[job.id] = job
+    job.save()
+    job_state_store.set(AnalysisJob.owner_key(session_key), job.id)
+    profile = start_request_profile()
+    job_executor.submit(profiled_context(profile).run, run_batch_analysis_job, job, token_info["access_token"], items, flagged_matcher, match_format)
+    log.info(f"Queued batch analysis job {job.id} ({len(items)} items).")
+
+    if wants_async_response(data):
+        return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}), 202
+    return finished_job_response(job, profile)
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """Progress of a job, plus its result once finished"""
+    state = get_owned_job_state(job_id, current_session_key())
+    if not state: return jsonify({"error": "Job not found."}), 404
+    return jsonify(public_job_state(state))
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    state = get_owned_job_state(job_id, current_session_key())
+    if not state: return jsonify({"error": "Job not found."}), 404
+    if state["status"] not in AnalysisJob.FINISHED_STATES:
+        with running_jobs_lock: job = running_jobs.get(job_id)
+        # The job may be running in another worker process; it picks the flag up from the shared store
+        if job: job.request_cancel()
+        else: job_state_store.set(AnalysisJob.cancel_key(job_id), True)
+        log.info(f"Cancellation requested for job {job_id}.")
+        state = job_state_store.get(AnalysisJob.state_key(job_id)) or state
+    return jsonify(public_job_state(state, include_result=False))
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint (this process only)"""
+    if METRICS_TOKEN and request.headers.get("Authorization", "") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized."}), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.cli.command("compress-static")
+def compress_static_command():
+    """Write the gzip/brotli variants of the frontend build (run at deploy time)."""
+    static_assets.build()  # Loading the app already indexed the build; this re-checks it and reports the result
+
+@app.cli.command("import-lyrics")
+@click.argument("source", type=click.Path(exists=True, dir_okay=False))
+def import_lyrics_command(source):
+    """Import an LRCLIB database dump (.sqlite3/.db) or a JSON-lines corpus into the local lyrics index."""
+    index = get_local_lyrics_index()
+    count = index.import_jsonl(source) if source.endswith((".jsonl", ".ndjson")) else index.import_lrclib_dump(source)
+    log.info(f"✅ Imported {count} lyrics into {LOCAL_LYRICS_DB}.")
 
 if __name__ == "__main__":
     is_production = os.environ.get('RENDER', False)
-    if not is_production and not os.path.exists('build'):
-        print("WARNING: 'build' folder not found. Frontend may not be served.", flush=True)
+    if not is_production and not os.path.exists(BUILD_FOLDER):
+        log.warning("WARNING: 'build' folder not found. Frontend may not be served.")
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=not is_production)
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""
+Benchmarks for the analysis pipeline, run against local stand-ins for Spotify and LRCLIB.
+
+    python benchmark.py                                    # default scenarios
+    python benchmark.py --sizes 1 100 5000 --latency-ms 30 --error-rate 0.02
+    python benchmark.py --compare benchmark-results/old.json benchmark-results/new.json
+
+Both services are served from threads in this process, with configurable latency
+and error rates, and are filled with seeded synthetic albums, playlists and lyrics
+so runs are reproducible. Results are written as JSON (one record per scenario)
+to benchmark-results/ so runs can be compared.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import string
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+VOCABULARY = ("love night baby heart dance feel time light fire road dream rain sky home gone away "
+              "tonight forever money city girl boy world alive hold know never always").split()
+TITLE_SUFFIXES = ("", "", "", " (feat. Guest Artist)", " - Remastered 2011", " (Live)", " [feat. Someone]")
+
+
+# --- Synthetic catalog ---
+class Catalog:
+    """Seeded tracks, albums, playlists and lyrics served by the fake Spotify and LRCLIB servers"""
+
+    def __init__(self, seed, flagged_vocabulary, flag_rate, missing_lyrics_rate, clean_title):
+        self.rng = random.Random(seed)
+        self.flagged_vocabulary = flagged_vocabulary; self.flag_rate = flag_rate
+        self.missing_lyrics_rate = missing_lyrics_rate; self.clean_title = clean_title
+        self.tracks = {}; self.albums = {}; self.playlists = {}; self.lyrics = {}
+
+    def _id(self):
+        return "".join(self.rng.choices(string.ascii_letters + string.digits, k=22))
+
+    def _lyrics(self):
+        lines = []; seconds = 5.0
+        for _ in range(self.rng.randint(8, 150)):
+            words = self.rng.choices(VOCABULARY, k=self.rng.randint(3, 10))
+            if self.rng.random() < self.flag_rate: words.insert(self.rng.randrange(len(words) + 1), self.rng.choice(self.flagged_vocabulary))
+            lines.append((seconds, " ".join(words)))
+            seconds += self.rng.uniform(1.5, 6)
+        synced = "\n".join(f"[{int(t // 60):02d}:{t % 60:05.2f}] {text}" for t, text in lines)
+        return synced, "\n".join(text for _, text in lines)
+
+    def new_track(self, album_name):
+        track_id = self._id(); artist = f"Artist {self.rng.randint(1, 500)}"
+        name = " ".join(self.rng.choices(VOCABULARY, k=self.rng.randint(1, 4))).title() + self.rng.choice(TITLE_SUFFIXES)
+        track = {"id": track_id, "name": name, "artists": [{"name": artist}], "album": {"name": album_name, "images": []},
+                 "duration_ms": self.rng.randint(120000, 360000), "external_ids": {"isrc": f"BENCH{self.rng.randrange(10**10):010d}"},
+                 "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"}}
+        self.tracks[track_id] = track
+        if self.rng.random() >= self.missing_lyrics_rate:
+            synced, plain = self._lyrics()
+            self.lyrics[(self.clean_title(name).lower(), artist.lower())] = {"id": len(self.lyrics) + 1, "syncedLyrics": synced, "plainLyrics": plain}
+        return track
+
+    def new_album(self, size):
+        album_id = self._id(); name = f"Album {album_id[:6]}"
+        tracks = [self.new_track(name) for _ in range(size)]
+        self.albums[album_id] = {"name": name, "artists": tracks[0]["artists"], "images": [], "track_ids": [t["id"] for t in tracks]}
+        return album_id
+
+    def new_playlist(self, size):
+        playlist_id = self._id()
+        self.playlists[playlist_id] = [self.new_track(f"Album {self.rng.randint(1, 200)}")["id"] for _ in range(size)]
+        return playlist_id
+
+
+# --- Fake upstream servers ---
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so connection pooling behaves as it does against the real services
+    catalog = None; latency = 0.0; error_rate = 0.0; rng = random.Random(0)
+
+    def log_message(self, *args): pass
+
+    def _send(self, status, body=None, headers=None):
+        payload = json.dumps(body if body is not None else {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items(): self.send_header(name, value)
+        self.end_headers(); self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.latency: time.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if self.rng.random() < self.error_rate:
+            # Mix of throttling and server errors, the two failures the outbound scheduler handles
+            if self.rng.random() < 0.5: return self._send(429, self.error_body(429, "Too many requests"), {"Retry-After": "0"})
+            return self._send(503, self.error_body(503, "Service unavailable"))
+        url = urlparse(self.path)
+        status, body = self.route(url.path.strip("/").split("/"), {k: v[0] for k, v in parse_qs(url.query).items()})
+        self._send(status, body)
+
+class FakeSpotifyHandler(FakeUpstreamHandler):
+    @staticmethod
+    def error_body(status, message): return {"error": {"status": status, "message": message}}
+
+    def route(self, parts, query):
+        catalog = self.catalog; parts = parts[1:]  # Drop the "v1" prefix
+        if parts == ["tracks"]: return 200, {"tracks": [catalog.tracks.get(i) for i in query.get("ids", "").split(",")]}
+        if parts[0] == "tracks" and parts[1] in catalog.tracks: return 200, catalog.tracks[parts[1]]
+        if parts[0] == "albums" and parts[1] in catalog.albums:
+            album = catalog.albums[parts[1]]
+            if len(parts) == 2: return 200, {k: v for k, v in album.items() if k != "track_ids"}
+            offset = int(query.get("offset", 0)); limit = int(query.get("limit", 50))
+            return 200, {"items": [{"id": i} for i in album["track_ids"][offset:offset + limit]], "next": None}
+        if parts[0] == "playlists" and parts[1] in catalog.playlists:
+            track_ids = catalog.playlists[parts[1]]
+            if len(parts) == 2: return 200, {"name": f"Playlist {parts[1][:6]}", "owner": {"display_name": "bench"}, "images": [],
+                                             "tracks": {"total": len(track_ids)}, "snapshot_id": f"snap-{parts[1]}", "public": True}
+            offset = int(query.get("offset", 0)); limit = int(query.get("limit", 100))
+            page = track_ids[offset:offset + limit]
+            return 200, {"items": [{"is_local": False, "track": catalog.tracks[i]} for i in page], "offset": offset, "total": len(track_ids),
+                         "next": "more" if offset + limit < len(track_ids) else None}
+        return 404, self.error_body(404, "Not found")
+
+class FakeLrclibHandler(FakeUpstreamHandler):
+    @staticmethod
+    def error_body(status, message): return {"statusCode": status, "message": message}
+
+    def route(self, parts, query):
+        found = self.catalog.lyrics.get((query.get("track_name", "").lower(), query.get("artist_name", "").lower()))
+        return (200, found) if found else (404, self.error_body(404, "Failed to find specified track"))
+
+def start_server(handler_class, catalog, latency_ms, error_rate, seed):
+    handler = type(handler_class.__name__, (handler_class,), {"catalog": catalog, "latency": latency_ms / 1000,
+                                                              "error_rate": error_rate, "rng": random.Random(seed)})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler); server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# --- Measurements ---
+def percentile(values, pct):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def timing_summary(seconds, prefix):
+    return {f"{prefix}_p50_ms": round(percentile(seconds, 50) * 1000, 3), f"{prefix}_p99_ms": round(percentile(seconds, 99) * 1000, 3),
+            f"{prefix}_mean_ms": round(statistics.fmean(seconds) * 1000, 3)}
+
+@contextlib.contextmanager
+def timed_track_analyses(engine, durations):
+    """Record how long each track analysis takes by wrapping the function the worker pool calls"""
+    original = engine.analyze_track_safely
+    def timed(*args):
+        start = time.perf_counter()
+        try: return original(*args)
+        finally: durations.append(time.perf_counter() - start)
+    engine.analyze_track_safely = timed
+    try: yield
+    finally: engine.analyze_track_safely = original
+
+def reset_engine_caches(engine):
+    """Each run starts cold, so every track goes through the fake upstreams"""
+    engine.spotify_cache = engine.SpotifyMetadataCache(engine.SPOTIFY_CACHE_MAX_WEIGHT)
+
+def bench_analyze(engine, client, url_type, item_id, size, languages, repeat, measure_memory):
+    body = {"url": f"https://open.spotify.com/{url_type}/{item_id}", "selected_defaults": languages, "incremental": False}
+    run_seconds = []; track_seconds = []; statuses = {}
+    for _ in range(repeat):
+        reset_engine_caches(engine)
+        with timed_track_analyses(engine, track_seconds):
+            start = time.perf_counter()
+            response = client.post("/analyze", json=body)
+            run_seconds.append(time.perf_counter() - start)
+        if response.status_code != 200: raise RuntimeError(f"/analyze {url_type} {size} failed: {response.status_code} {response.get_json()}")
+        for track in response.get_json()["tracks"]: statuses[track["status"]] = statuses.get(track["status"], 0) + 1
+    result = {"benchmark": "analyze", "type": url_type, "size": size, "word_lists": "+".join(languages), "runs": repeat,
+              "throughput_tracks_per_s": round(size / percentile(run_seconds, 50), 2),
+              **timing_summary(run_seconds, "request"), **timing_summary(track_seconds, "track"),
+              "statuses": {k: v // repeat for k, v in statuses.items()}}
+    if measure_memory:
+        reset_engine_caches(engine); tracemalloc.start()
+        try: client.post("/analyze", json=body); result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally: tracemalloc.stop()
+    return result
+
+def bench_matching(engine, catalog, languages, label, sample):
+    """CPU cost of matching alone: analyze_track_lyrics with lyrics served from memory"""
+    # Built directly: get_flagged_matcher would answer from the matchers bench_analyze already cached
+    default_lists = engine.word_list_index.lists
+    words = set().union(*(default_lists[lang_code] for lang_code in languages if lang_code in default_lists))
+    compile_start = time.perf_counter()
+    matcher = engine.FlaggedWordMatcher(words)
+    compile_seconds = time.perf_counter() - compile_start
+    tracks = [t for t in catalog.tracks.values() if (catalog.clean_title(t["name"]).lower(), t["artists"][0]["name"].lower()) in catalog.lyrics][:sample]
+    parsed = {}
+    for key, entry in catalog.lyrics.items():
+        lines = [(int(m) * 60 + float(s), txt.strip()) for m, s, txt in engine.LRCLIB_TIME_PATTERN.findall(entry["syncedLyrics"]) if txt.strip()]
+        parsed[key] = (lines, None, entry["plainLyrics"])
+    original = engine.get_lyrics
+    engine.get_lyrics = lambda title, artist, album, duration: parsed.get((title.lower(), artist.lower()), (None, None, None))
+    per_track = []
+    try:
+        for number, track in enumerate(tracks, start=1):
+            start = time.perf_counter()
+            engine.analyze_track_lyrics(track, number, matcher)
+            per_track.append(time.perf_counter() - start)
+    finally:
+        engine.get_lyrics = original
+    return {"benchmark": "matching", "word_lists": label, "words": len(matcher), "tracks": len(tracks),
+            "compile_ms": round(compile_seconds * 1000, 3), "matcher_bytes": matcher.approx_size(),
+            **timing_summary(per_track, "track")}
+
+def bench_clean_track_title(engine, catalog, iterations):
+    titles = [t["name"] for t in catalog.tracks.values()] or ["Song (feat. Someone) - Remastered 2011"]
+    start = time.perf_counter()
+    for i in range(iterations): engine.clean_track_title(titles[i % len(titles)])
+    elapsed = time.perf_counter() - start
+    return {"benchmark": "clean_track_title", "calls": iterations, "ns_per_call": round(elapsed / iterations * 1e9, 1),
+            "calls_per_s": round(iterations / elapsed)}
+
+
+# --- Runner ---
+def git_commit():
+    try: return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+def run(args):
+    # The app reads its configuration at import, so the stand-ins are wired in through the environment first
+    flagged_vocabulary = []  # Filled from the English list once the app is importable
+    os.environ.update(SPOTIPY_CLIENT_ID="benchmark", SPOTIPY_CLIENT_SECRET="benchmark", SPOTIPY_REDIRECT_URI="http://127.0.0.1/callback",
+                      LYRICS_CACHE_PATH="", SPOTIFY_CACHE_PATH="", STATE_BACKEND="memory", LYRICS_PROVIDER="lrclib",
+                      LOG_LEVEL="DEBUG" if args.verbose else "WARNING",
+                      LRCLIB_RATE_LIMIT=str(args.rate_limit), SPOTIFY_RATE_LIMIT=str(args.rate_limit))
+    if args.workers: os.environ["LRCLIB_MAX_WORKERS"] = str(args.workers)
+    catalog = Catalog(args.seed, flagged_vocabulary, args.flag_rate, args.missing_lyrics_rate, clean_title=None)
+    spotify_server, spotify_url = start_server(FakeSpotifyHandler, catalog, args.latency_ms, args.error_rate, args.seed)
+    lrclib_server, lrclib_url = start_server(FakeLrclibHandler, catalog, args.latency_ms, args.error_rate, args.seed + 1)
+    os.environ.update(SPOTIFY_API_URL=f"{spotify_url}/v1", LRCLIB_API_URL=f"{lrclib_url}/api")
+    sys.path.insert(0, ROOT); os.chdir(ROOT)
+    import app as app_module
+    import engine
+    catalog.clean_title = engine.clean_track_title
+    with open(engine.DEFAULT_LIST_FILES["en"], "r", encoding="utf-8") as f:
+        flagged_vocabulary.extend(line.strip().lower() for line in f if line.strip() and " " not in line.strip())
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess["token_info"] = {"access_token": "benchmark", "refresh_token": "benchmark", "expires_at": time.time() + 10 * 24 * 3600}
+    word_list_sets = {"en": ["en"], "all": sorted(engine.DEFAULT_LIST_FILES)}
+    results = []
+    try:
+        for size in args.sizes:
+            scenarios = [("playlist", catalog.new_playlist(size))]
+            if size <= 50: scenarios.insert(0, ("album", catalog.new_album(size)))  # /analyze reads one page of album tracks
+            if size == 1: scenarios.insert(0, ("track", catalog.new_track("Single")["id"]))
+            for url_type, item_id in scenarios:
+                for label in args.word_lists:
+                    result = bench_analyze(engine, client, url_type, item_id, size, word_list_sets[label], args.repeat, not args.no_memory)
+                    results.append(result)
+                    print(f"analyze {url_type:<8} {size:>5} tracks [{label}]: {result['throughput_tracks_per_s']:>8} tracks/s, "
+                          f"request p50 {result['request_p50_ms']} ms, track p99 {result['track_p99_ms']} ms", flush=True)
+        if not catalog.tracks: catalog.new_playlist(200)
+        for label in args.word_lists:
+            result = bench_matching(engine, catalog, word_list_sets[label], label, args.match_sample)
+            results.append(result)
+            print(f"matching [{label}] {result['words']} words: compile {result['compile_ms']} ms, "
+                  f"per track p50 {result['track_p50_ms']} ms / p99 {result['track_p99_ms']} ms", flush=True)
+        result = bench_clean_track_title(engine, catalog, args.title_iterations); results.append(result)
+        print(f"clean_track_title: {result['ns_per_call']} ns/call", flush=True)
+    finally:
+        spotify_server.shutdown(); lrclib_server.shutdown()
+
+    report = {"meta": {"timestamp": datetime.now(timezone.utc).isoformat(), "git_commit": git_commit(), "python": platform.python_version(),
+                       "platform": platform.platform(), "cpu_count": os.cpu_count(), "args": vars(args)},
+              "results": results}
+    output = args.output or os.path.join(ROOT, "benchmark-results", datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+    print(f"Results written to {output}", flush=True)
+
+def result_key(result):
+    return tuple(str(result.get(field, "")) for field in ("benchmark", "type", "size", "word_lists"))
+
+def compare(baseline_path, candidate_path):
+    """Print every numeric metric shared by two result files with the candidate/baseline ratio"""
+    with open(baseline_path, encoding="utf-8") as f: baseline = {result_key(r): r for r in json.load(f)["results"]}
+    with open(candidate_path, encoding="utf-8") as f: candidate = json.load(f)["results"]
+    for result in candidate:
+        before = baseline.get(result_key(result))
+        if not before: continue
+        print(" ".join(part for part in result_key(result) if part))
+        for metric, value in result.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(before.get(metric), (int, float)): continue
+            ratio = f"{value / before[metric]:.2f}x" if before[metric] else "n/a"
+            print(f"    {metric:<26} {before[metric]:>14} -> {value:<14} ({ratio})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 50, 500, 5000], help="Tracks per album/playlist scenario")
+    parser.add_argument("--word-lists", nargs="+", choices=("en", "all"), default=["en", "all"], help="Word list selections to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed /analyze runs per scenario")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mean latency of the fake Spotify and LRCLIB servers")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake upstream requests answered with 429/503")
+    parser.add_argument("--rate-limit", type=float, default=1000, help="Outbound requests per second allowed to each fake upstream")
+    parser.add_argument("--workers", type=int, help="LRCLIB_MAX_WORKERS for the run")
+    parser.add_argument("--flag-rate", type=float, default=0.03, help="Chance a lyric line contains a flagged word")
+    parser.add_argument("--missing-lyrics-rate", type=float, default=0.05, help="Fraction of tracks LRCLIB has no lyrics for")
+    parser.add_argument("--match-sample", type=int, default=1000, help="Tracks timed in the matching benchmark")
+    parser.add_argument("--title-iterations", type=int, default=100000, help="Calls timed in the clean_track_title benchmark")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass that measures peak memory")
+    parser.add_argument("--output", help="Result file (default: benchmark-results/<UTC timestamp>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare two result files instead of running")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own log output")
+    args = parser.parse_args()
+    if args.compare: return compare(*args.compare)
+    run(args)
+
+if __name__ == "__main__":
+    main()
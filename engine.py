@@ -0,0 +1,1644 @@
+"""
+The analysis pipeline without the web app: Spotify fetching, lyrics lookup and flagged-word matching.
+
+    import engine
+    matcher, _ = engine.get_flagged_matcher("", ["en"])
+    for result in engine.scan_tracks(map(engine.track_from_record, rows), matcher):
+        ...
+
+app.py serves these stages over HTTP and scan.py runs them over CSV/JSONL track lists.
+Nothing here imports Flask, and spotipy is only needed for the Spotify fetching stage.
+"""
+import os
+import sys
+import atexit
+import bisect
+import contextvars
+import logging
+import logging.handlers
+import json
+import re
+from datetime import datetime
+from dotenv import load_dotenv
+import time
+import random
+import sqlite3
+import threading
+import unicodedata
+import itertools
+import math
+import hashlib
+import heapq
+import queue
+import multiprocessing
+import requests
+from contextlib import contextmanager
+from functools import lru_cache
+from array import array
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+try:
+    import spotipy  # Only the Spotify fetching stage needs it
+except ImportError:
+    spotipy = None
+
+# Load environment variables
+load_dotenv()
+
+# --- Logging: levelled, and written by a background listener so callers never block on stdout ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json"
+LOG_STREAM = os.getenv("LOG_STREAM", "stdout").lower()  # "stdout" or "stderr" (scan.py keeps stdout for results)
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, including any `extra=` fields passed to the log call"""
+    STANDARD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {"time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"), "level": record.levelname,
+                 "thread": record.threadName, "message": record.getMessage()}
+        entry.update((key, value) for key, value in vars(record).items() if key not in self.STANDARD_FIELDS)
+        return json.dumps(entry, default=str)
+
+class BackgroundLogHandler(logging.handlers.QueueHandler):
+    """Queues records for a listener thread that writes them to `target`; the thread starts with the first record"""
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self._listener = logging.handlers.QueueListener(self.queue, target)
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, record):
+        if not self._started:
+            with self._start_lock:
+                if not self._started:
+                    self._listener.start(); atexit.register(self._listener.stop); self._started = True
+        super().enqueue(record)
+
+def configure_logging():
+    handler = logging.StreamHandler(sys.stderr if LOG_STREAM == "stderr" else sys.stdout)
+    handler.setFormatter(JsonLogFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(message)s"))
+    logger = logging.getLogger("fcc_song_checker")
+    logger.setLevel(LOG_LEVEL); logger.addHandler(BackgroundLogHandler(handler)); logger.propagate = False
+    return logger
+
+log = configure_logging()
+
+# --- Metrics (Prometheus text format, per process) and per-stage profiling ---
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name; self.help_text = help_text
+        self._values = {}  # sorted label items -> value
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock: self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock: return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels): self.inc(-amount, **labels)
+
+class CallbackGauge:
+    """Gauge computed at scrape time; `collect` returns [(labels, value)]"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, collect):
+        self.name = name; self.help_text = help_text; self.collect = collect
+
+    def samples(self):
+        return [(self.name, labels, value) for labels, value in self.collect()]
+
+class Histogram:
+    kind = "histogram"
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name; self.help_text = help_text; self.buckets = tuple(buckets)
+        self._values = {}  # sorted label items -> [per-bucket counts (last is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items())); slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[slot] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        with self._lock: values = [(dict(key), list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for labels, counts, total, count in values:
+            for bound, cumulative in zip(self.buckets + (float("inf"),), itertools.accumulate(counts)):
+                yield f"{self.name}_bucket", {**labels, "le": "+Inf" if bound == float("inf") else repr(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+class MetricsRegistry:
+    def __init__(self): self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric); return metric
+
+    def render(self):
+        def label_text(labels):
+            if not labels: return ""
+            escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"' for k, v in labels.items())
+            return "{" + ",".join(escaped) + "}"
+        lines = []
+        for metric in self.metrics:
+            lines += [f"# HELP {metric.name} {metric.help_text}", f"# TYPE {metric.name} {metric.kind}"]
+            lines += [f"{name}{label_text(labels)} {value:g}" for name, labels, value in metric.samples()]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+upstream_request_seconds = metrics.register(Histogram("fcc_upstream_request_seconds", "LRCLIB and Spotify request latency, per attempt."))
+upstream_requests_total = metrics.register(Counter("fcc_upstream_requests_total", "LRCLIB and Spotify requests by outcome (ok, error, throttled, retryable)."))
+upstream_in_flight = metrics.register(Gauge("fcc_upstream_in_flight", "LRCLIB and Spotify requests currently open."))
+lyrics_match_seconds = metrics.register(Histogram("fcc_lyrics_match_seconds", "Time spent matching one track's lyrics against the word list.",
+                                                  (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)))
+track_analysis_seconds = metrics.register(Histogram("fcc_track_analysis_seconds", "Lyrics lookup plus matching for one track."))
+tracks_analyzed_total = metrics.register(Counter("fcc_tracks_analyzed_total", "Tracks analyzed, by result status."))
+job_tracks_per_second = metrics.register(Histogram("fcc_job_tracks_per_second", "Throughput of each finished analysis job.",
+                                                   (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)))
+cache_requests_total = metrics.register(Counter("fcc_cache_requests_total", "Cache lookups by cache (lyrics, spotify, matcher) and result (hit, miss)."))
+
+active_profile = contextvars.ContextVar("active_profile", default=None)
+
+class StageProfile:
+    """Time per pipeline stage for one profiled request; stages running on parallel threads add up past wall time"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}  # stage -> [count, total seconds, max seconds]
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            count, total, longest = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (count + 1, total + seconds, max(longest, seconds))
+
+    def summary(self):
+        with self._lock: stages = dict(self._stages)
+        return {"wall_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                "stages": {stage: {"count": count, "total_ms": round(total * 1000, 2), "max_ms": round(longest * 1000, 2)}
+                           for stage, (count, total, longest) in stages.items()}}
+
+    def server_timing(self):
+        """Server-Timing header value (total time per stage, plus wall time)"""
+        summary = self.summary()
+        return ", ".join([f"{stage};dur={s['total_ms']}" for stage, s in summary["stages"].items()] + [f"total;dur={summary['wall_ms']}"])
+
+def profiled_context(profile):
+    """Context for a job submitted to a pool, carrying `profile` into the worker and the lookups it fans out"""
+    context = contextvars.copy_context()
+    context.run(active_profile.set, profile)
+    return context
+
+@contextmanager
+def timed_stage(stage, histogram=None, **labels):
+    """Time a block into `histogram` and, while a request is being profiled, into its stage totals"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if histogram is not None: histogram.observe(elapsed, **labels)
+        profile = active_profile.get()
+        if profile is not None: profile.add(stage, elapsed)
+
+# --- Pre-compiled regex patterns for performance ---
+FEAT_PATTERN = re.compile(r"\s+\(feat\.[^)]+\)", re.IGNORECASE)
+FEAT_BRACKET_PATTERN = re.compile(r"\s+\[feat\.[^]]+\]", re.IGNORECASE)
+VERSION_PATTERN = re.compile(r"\s+\((Remix|Live|Acoustic|Radio Edit)\)", re.IGNORECASE)
+SUFFIX_PATTERN = re.compile(r"\s+-\s+(Remix|Live|Acoustic|Radio Edit|From .*|Mono|Stereo)", re.IGNORECASE)
+PART_VOL_PATTERN = re.compile(r"\s+\((Pt\.|Vol\.)\s*\d+\)", re.IGNORECASE)
+LRCLIB_TIME_PATTERN = re.compile(r"\[(\d+):(\d+\.\d+)\]\s*(.*)")
+
+# --- Concurrent LRCLIB lookups (parallel tracks per analysis, analyses per server process) ---
+LRCLIB_MAX_WORKERS = max(1, int(os.getenv("LRCLIB_MAX_WORKERS", "8")))
+ANALYSIS_JOB_WORKERS = max(1, int(os.getenv("ANALYSIS_JOB_WORKERS", "4")))
+
+# --- Persistent lyrics cache (set LYRICS_CACHE_PATH="" to disable) ---
+LYRICS_CACHE_PATH = os.getenv("LYRICS_CACHE_PATH", "lyrics_cache.sqlite3")
+LYRICS_CACHE_TTL = int(os.getenv("LYRICS_CACHE_TTL", str(30 * 24 * 3600)))  # Found lyrics: 30 days
+LYRICS_CACHE_NEGATIVE_TTL = int(os.getenv("LYRICS_CACHE_NEGATIVE_TTL", str(24 * 3600)))  # Not found: 1 day
+LYRICS_CACHE_MAX_ENTRIES = int(os.getenv("LYRICS_CACHE_MAX_ENTRIES", "100000"))
+
+# --- Lyrics provider: "lrclib" (live API) or "local" (offline index built from an LRCLIB dump or corpus) ---
+LYRICS_PROVIDER = os.getenv("LYRICS_PROVIDER", "lrclib").lower()
+LOCAL_LYRICS_DB = os.getenv("LOCAL_LYRICS_DB", "local_lyrics.sqlite3")
+LOCAL_LYRICS_DURATION_TOLERANCE = float(os.getenv("LOCAL_LYRICS_DURATION_TOLERANCE", "2"))  # Seconds
+
+# --- Spotify metadata cache (set SPOTIFY_CACHE_PATH to also persist it to disk) ---
+SPOTIFY_CACHE_TTL = int(os.getenv("SPOTIFY_CACHE_TTL", str(24 * 3600)))  # Tracks, albums, playlist snapshots
+SPOTIFY_PLAYLIST_TTL = int(os.getenv("SPOTIFY_PLAYLIST_TTL", "300"))  # Playlist header, which carries the current snapshot_id
+SPOTIFY_SEARCH_TTL = int(os.getenv("SPOTIFY_SEARCH_TTL", "600"))
+SPOTIFY_CACHE_MAX_WEIGHT = int(os.getenv("SPOTIFY_CACHE_MAX_WEIGHT", "50000"))  # Roughly the number of track objects kept in memory
+SPOTIFY_CACHE_PATH = os.getenv("SPOTIFY_CACHE_PATH", "")
+
+# --- Text folding applied to flagged words and lyrics before matching ---
+MATCH_FOLD_LEETSPEAK = os.getenv("MATCH_FOLD_LEETSPEAK", "1") != "0"  # "sh1t", "a$$" match "shit", "ass"
+
+# --- Compiled matcher cache (per word-selection fingerprint) ---
+MATCHER_CACHE_MAX_BYTES = int(os.getenv("MATCHER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# --- Outbound scheduler limits (requests per second per upstream, retries, circuit breaker) ---
+LRCLIB_RATE_LIMIT = float(os.getenv("LRCLIB_RATE_LIMIT", "20"))
+SPOTIFY_RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", "10"))
+OUTBOUND_MAX_ATTEMPTS = max(1, int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "4")))
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))  # Consecutive failures that open the circuit
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "30"))  # Seconds before a trial request is let through
+
+# --- Upstream base URLs (override to use a mirror, or the local stand-ins in benchmark.py) ---
+LRCLIB_API_URL = os.getenv("LRCLIB_API_URL", "https://lrclib.net/api").rstrip("/")
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1").rstrip("/") + "/"
+
+# --- Requests sessions for connection pooling (one pooled connection per worker) ---
+# Retries are left to the outbound scheduler, which honours Retry-After. Every running
+# analysis has its own LRCLIB_MAX_WORKERS lookup threads, so the LRCLIB pool keeps a
+# connection for each of them; a smaller pool would drop the extras instead of reusing them.
+requests_session = requests.Session()
+adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=ANALYSIS_JOB_WORKERS * LRCLIB_MAX_WORKERS, max_retries=0)
+requests_session.mount('http://', adapter)
+requests_session.mount('https://', adapter)
+spotify_session = requests.Session()
+spotify_adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=20, max_retries=0)
+spotify_session.mount('http://', spotify_adapter)
+spotify_session.mount('https://', spotify_adapter)
+
+class UpstreamUnavailableError(Exception):
+    """Raised without calling the upstream while its circuit breaker is open."""
+
+class UpstreamLimiter:
+    """
+    Token bucket plus circuit breaker for one upstream host.
+
+    The rate starts at `max_rate`, halves on every 429/5xx (AIMD) and creeps back up
+    on successes. A Retry-After pauses the whole bucket; while the pause has more than
+    `max_wait` seconds left, calls fail fast instead of sleeping through it. After
+    `failure_threshold` consecutive failures the circuit opens and calls fail fast until
+    `cooldown` has passed, when a single trial request decides whether it closes again.
+    """
+
+    def __init__(self, name, max_rate, failure_threshold, cooldown, max_wait):
+        self.name = name; self.max_rate = max_rate; self.min_rate = max(max_rate / 20, 0.2)
+        self.failure_threshold = failure_threshold; self.cooldown = cooldown; self.max_wait = max_wait
+        self.rate = max_rate; self._tokens = max_rate; self._updated = time.monotonic(); self._blocked_until = 0
+        self._failures = 0; self._opened_at = None; self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait for a token; raises UpstreamUnavailableError while the circuit is open or a long Retry-After lasts"""
+        with self._lock:
+            now = time.monotonic()
+            if self._blocked_until - now > self.max_wait:
+                raise UpstreamUnavailableError(f"{self.name} is unavailable (asked to retry in {self._blocked_until - now:.0f}s).")
+            if self._opened_at is not None:
+                if now - self._opened_at < self.cooldown or self._trial_in_flight:
+                    raise UpstreamUnavailableError(f"{self.name} is unavailable (circuit open).")
+                self._trial_in_flight = True
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate); self._updated = now
+            self._tokens -= 1  # Reserve a token now, so concurrent callers queue behind each other
+            wait = max(self._blocked_until - now, -self._tokens / self.rate if self._tokens < 0 else 0)
+        if wait > 0: time.sleep(wait)
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None: log.info(f"✅ {self.name} recovered, closing circuit.")
+            self._failures = 0; self._opened_at = None; self._trial_in_flight = False
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def record_failure(self, throttled=False, retry_after=None):
+        """Slow down after a failed call; returns True when the circuit is (now) open"""
+        with self._lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after: self._blocked_until = max(self._blocked_until, now + retry_after)
+            self._trial_in_flight = False
+            if throttled: return False  # Rate limiting means the upstream is up; only slow down
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                log.warning(f"⚠️ {self.name} failing ({self._failures} in a row), opening circuit for {self.cooldown:.0f}s.")
+                self._opened_at = now
+            return self._opened_at is not None
+
+class OutboundScheduler:
+    """
+    Single gateway for LRCLIB and Spotify calls: per-host rate limiting, retries and circuit breaking.
+
+    `call` retries 429s, 5xx responses and connection errors with full-jitter exponential
+    backoff (or the upstream's Retry-After), up to `max_attempts` in total.
+    """
+    BACKOFF_BASE = 0.5
+    MAX_RETRY_DELAY = 30
+
+    def __init__(self, limits, max_attempts, failure_threshold, cooldown):
+        self.max_attempts = max_attempts
+        self.limiters = {name: UpstreamLimiter(name, rate, failure_threshold, cooldown, self.MAX_RETRY_DELAY) for name, rate in limits.items()}
+
+    @staticmethod
+    def _classify(outcome):
+        """(retryable, throttled, retry_after) for a response or exception"""
+        if isinstance(outcome, requests.RequestException) and not isinstance(outcome, requests.HTTPError):
+            return True, False, None
+        status = getattr(outcome, "status_code", None) or getattr(outcome, "http_status", None)
+        if status is None: return False, False, None
+        headers = getattr(outcome, "headers", None) or {}
+        try: retry_after = float(headers.get("Retry-After")) if headers.get("Retry-After") else None
+        except (TypeError, ValueError): retry_after = None
+        return status == 429 or status >= 500, status == 429, retry_after
+
+    def call(self, upstream, fn):
+        limiter = self.limiters[upstream]
+        for attempt in range(1, self.max_attempts + 1):
+            limiter.acquire()
+            upstream_in_flight.inc(upstream=upstream)
+            try:
+                with timed_stage(upstream, upstream_request_seconds, upstream=upstream):
+                    outcome = fn(); error = None
+            except Exception as e:
+                outcome = error = e
+            finally:
+                upstream_in_flight.dec(upstream=upstream)
+            retryable, throttled, retry_after = self._classify(outcome)
+            upstream_requests_total.inc(upstream=upstream, outcome=("throttled" if throttled else "retryable") if retryable else ("error" if error is not None else "ok"))
+            if not retryable:
+                limiter.record_success()
+                if error is not None: raise error
+                return outcome
+            circuit_open = limiter.record_failure(throttled, retry_after)
+            delay = retry_after if retry_after is not None else random.uniform(0, self.BACKOFF_BASE * 2 ** attempt)
+            if circuit_open or attempt == self.max_attempts or delay > self.MAX_RETRY_DELAY:
+                if error is not None: raise error
+                return outcome
+            log.info(f"{upstream}: attempt {attempt} failed ({error or getattr(outcome, 'status_code', '')}), retrying in {delay:.2f}s.")
+            time.sleep(delay)
+
+outbound = OutboundScheduler({"lrclib": LRCLIB_RATE_LIMIT, "spotify": SPOTIFY_RATE_LIMIT},
+                             OUTBOUND_MAX_ATTEMPTS, CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN)
+
+class ScheduledSpotify:
+    """spotipy client wrapper that sends every API method call through the outbound scheduler."""
+
+    def __init__(self, sp):
+        self._sp = sp
+
+    def __getattr__(self, name):
+        attr = getattr(self._sp, name)
+        if not callable(attr): return attr
+        return lambda *args, **kwargs: outbound.call("spotify", lambda: attr(*args, **kwargs))
+
+def spotify_client(access_token):
+    """Spotify client for a user token, with spotipy's own retries disabled in favour of the scheduler"""
+    sp = spotipy.Spotify(auth=access_token, requests_session=spotify_session, retries=0, status_retries=0)
+    sp.prefix = SPOTIFY_API_URL
+    return ScheduledSpotify(sp)
+
+# --- REMOVED: Genius API setup ---
+# GENIUS_ACCESS_TOKEN = os.getenv("GENIUS_API_TOKEN")
+# genius = None # Removed Genius client
+
+# --- Default word lists, loaded on first use and reloaded when edited ---
+WORD_LIST_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "List-of-Dirty-Naughty-Obscene-and-Otherwise-Bad-Words")
+WORD_LIST_RELOAD_INTERVAL = int(os.getenv("WORD_LIST_RELOAD_INTERVAL", "30"))  # Seconds between source change checks
+
+DEFAULT_LIST_FILES = {
+    'ar': os.path.join(WORD_LIST_FOLDER, 'default_ar.txt'),
+    'zh': os.path.join(WORD_LIST_FOLDER, 'default_zh.txt'),
+    'cs': os.path.join(WORD_LIST_FOLDER, 'default_cs.txt'),
+    'da': os.path.join(WORD_LIST_FOLDER, 'default_da.txt'),
+    'nl': os.path.join(WORD_LIST_FOLDER, 'default_nl.txt'),
+    'en': os.path.join(WORD_LIST_FOLDER, 'default_en.txt'),
+    'eo': os.path.join(WORD_LIST_FOLDER, 'default_eo.txt'),
+    'fil': os.path.join(WORD_LIST_FOLDER, 'default_fil.txt'),
+    'fi': os.path.join(WORD_LIST_FOLDER, 'default_fi.txt'),
+    'fr': os.path.join(WORD_LIST_FOLDER, 'default_fr.txt'),
+    'fr-CA-u-sd-caqc': os.path.join(WORD_LIST_FOLDER, 'default_fr-CA-u-sd-caqc.txt'),
+    'de': os.path.join(WORD_LIST_FOLDER, 'default_de.txt'),
+    'hi': os.path.join(WORD_LIST_FOLDER, 'default_hi.txt'),
+    'hu': os.path.join(WORD_LIST_FOLDER, 'default_hu.txt'),
+    'it': os.path.join(WORD_LIST_FOLDER, 'default_it.txt'),
+    'ja': os.path.join(WORD_LIST_FOLDER, 'default_ja.txt'),
+    'kab': os.path.join(WORD_LIST_FOLDER, 'default_kab.txt'),
+    'tlh': os.path.join(WORD_LIST_FOLDER, 'default_tlh.txt'),
+    'ko': os.path.join(WORD_LIST_FOLDER, 'default_ko.txt'),
+    'no': os.path.join(WORD_LIST_FOLDER, 'default_no.txt'),
+    'fa': os.path.join(WORD_LIST_FOLDER, 'default_fa.txt'),
+    'pl': os.path.join(WORD_LIST_FOLDER, 'default_pl.txt'),
+    'pt': os.path.join(WORD_LIST_FOLDER, 'default_pt.txt'),
+    'ru': os.path.join(WORD_LIST_FOLDER, 'default_ru.txt'),
+    'es': os.path.join(WORD_LIST_FOLDER, 'default_es.txt'),
+    'sv': os.path.join(WORD_LIST_FOLDER, 'default_sv.txt'),
+    'th': os.path.join(WORD_LIST_FOLDER, 'default_th.txt'),
+    'tr': os.path.join(WORD_LIST_FOLDER, 'default_tr.txt'),
+}
+
+class WordListIndex:
+    """
+    The default word lists, cleaned and deduplicated.
+
+    Nothing is read at import time: the first caller reads the list files. Afterwards
+    their mtimes/sizes are re-checked every `reload_interval` seconds, so an edited
+    list is reloaded and hot-swapped without restarting workers. A language's matcher
+    is only built the first time it is asked for.
+    """
+
+    def __init__(self, list_files, reload_interval):
+        self.list_files = list_files; self.reload_interval = reload_interval
+        self._data = None; self._signature = None; self._next_check = 0
+        self._matchers = {}  # (content_hash, lang_code) -> FlaggedWordMatcher, for the current lists only
+        self._lock = threading.Lock(); self._matcher_lock = threading.Lock()
+
+    def _source_signature(self):
+        signature = []
+        for lang_code, filepath in sorted(self.list_files.items()):
+            try: st = os.stat(filepath); signature.append((lang_code, st.st_mtime_ns, st.st_size))
+            except OSError: signature.append((lang_code, None, None))
+        return tuple(signature)
+
+    def load(self):
+        """Read and clean the list files; returns {"content_hash", "lists"}"""
+        digest = hashlib.sha256(f"wordlists-leet{int(MATCH_FOLD_LEETSPEAK)}".encode())
+        lists = {}
+        for lang_code, filepath in sorted(self.list_files.items()):
+            digest.update(f"\0{lang_code}\0".encode())
+            try:
+                with open(filepath, "rb") as f: raw = f.read()
+            except FileNotFoundError:
+                log.warning(f"⚠️ Warning: Default list file not found: {filepath} for '{lang_code}'."); digest.update(b"\0missing"); continue
+            except OSError as e:
+                log.error(f"❌ Error loading {filepath} for '{lang_code}': {e}"); digest.update(b"\0missing"); continue
+            digest.update(raw)
+            try: words = {line.strip().lower() for line in raw.decode("utf-8").splitlines() if line.strip()}
+            except UnicodeDecodeError as e:
+                log.error(f"❌ Error loading {filepath} for '{lang_code}': {e}"); continue
+            if words: lists[lang_code] = tuple(sorted(words))
+            else: log.warning(f"⚠️ Warning: {filepath} for '{lang_code}' is empty.")
+        if not lists:
+            log.error("❌ WARNING: No default word lists were loaded successfully! Check file paths and names.")
+        return {"content_hash": digest.hexdigest(), "lists": lists}
+
+    def _refresh(self):
+        signature = self._source_signature()
+        if self._data is not None and signature == self._signature: return
+        data = self.load()
+        if self._data is None:
+            log.info(f"✅ Loaded {len(data['lists'])} word lists ({sum(map(len, data['lists'].values()))} words).")
+        elif data["content_hash"] != self._data["content_hash"]:
+            log.info(f"🔄 Word lists changed, reloaded {data['content_hash'][:12]}.")
+        if self._data is None or data["content_hash"] != self._data["content_hash"]: self._data = data
+        self._signature = signature
+
+    def current(self):
+        now = time.monotonic()
+        if self._data is None or now >= self._next_check:
+            with self._lock:
+                if self._data is None or now >= self._next_check:
+                    self._refresh(); self._next_check = now + self.reload_interval
+        return self._data
+
+    @property
+    def lists(self):
+        """lang_code -> sorted tuple of lowercased words"""
+        return self.current()["lists"]
+
+    @property
+    def version(self):
+        return self.current()["content_hash"][:16]
+
+    def matcher_for(self, lang_code):
+        """
+        (matcher, built) for one language: the matcher is built on first use and kept until
+        the lists change, and `built` tells whether this call built it. (None, False) for an unknown language.
+        """
+        data = self.current()
+        key = (data["content_hash"], lang_code)
+        matcher = self._matchers.get(key)
+        if matcher is not None or lang_code not in data["lists"]: return matcher, False
+        with self._matcher_lock:
+            matcher = self._matchers.get(key)
+            if matcher is not None: return matcher, False
+            matcher = FlaggedWordMatcher(data["lists"][lang_code])
+            # Matchers for lists that have since been edited are dropped
+            self._matchers = {k: m for k, m in self._matchers.items() if k[0] == key[0]}; self._matchers[key] = matcher
+        return matcher, True
+
+word_list_index = WordListIndex(DEFAULT_LIST_FILES, WORD_LIST_RELOAD_INTERVAL)
+
+# --- Key/value stores (SQLite-backed or in memory) ---
+class SQLiteStore:
+    """Base for SQLite-backed stores: one WAL-mode connection per thread, so instances are thread-safe."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+class MemoryStateStore:
+    """
+    In-process key/value store where every entry lives `ttl` seconds from its last write.
+
+    Entries are kept in write order, which with a single TTL is also expiry order,
+    so expiring pops from the front and never scans live entries. With `max_weight`
+    the least recently written entries are also dropped once the entries' total
+    weight (`weigh(value)`, 1 each by default) passes it.
+    """
+
+    def __init__(self, ttl, max_weight=None, weigh=None):
+        self.ttl = ttl; self.max_weight = max_weight; self.weigh = weigh or (lambda value: 1)
+        self._data = OrderedDict()  # key -> (expires_at, value, weight)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._data:
+            key, (expires_at, _, weight) = next(iter(self._data.items()))
+            if expires_at > now and (self.max_weight is None or self._total <= self.max_weight): break
+            self._data.popitem(last=False); self._total -= weight
+
+    def get(self, key):
+        with self._lock:
+            self._expire(time.time())
+            entry = self._data.get(key)
+            return entry[1] if entry else None
+
+    def set(self, key, value):
+        weight = self.weigh(value)
+        with self._lock:
+            now = time.time()
+            old = self._data.pop(key, None)
+            if old: self._total -= old[2]
+            if self.max_weight is None or weight <= self.max_weight:
+                self._data[key] = (now + self.ttl, value, weight); self._total += weight
+            self._expire(now)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old: self._total -= old[2]
+
+class SQLiteStateStore(SQLiteStore):
+    """
+    Key/value store in a SQLite file shared by every worker process on the host.
+
+    Same interface as MemoryStateStore; values are stored as JSON and expired rows
+    are removed through the expires_at index, so a sweep only touches expired rows.
+    """
+    PURGE_INTERVAL = 30  # Seconds between expiry sweeps
+
+    def __init__(self, path, ttl):
+        super().__init__(path)
+        self.ttl = ttl
+        self._next_purge = 0
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS state_expires_at ON state (expires_at);
+        """)
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value FROM state WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        """Store `value` for `ttl` seconds (the store's default TTL when omitted)"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)", (key, json.dumps(value), now + (ttl or self.ttl)))
+        if now >= self._next_purge:
+            self._next_purge = now + self.PURGE_INTERVAL
+            conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM state WHERE key = ?", (key,))
+
+# --- Title cleaning, text folding and flagged-word matching ---
+@lru_cache(maxsize=512)
+def clean_track_title(title):
+    """Clean track title using pre-compiled regex patterns (cached for performance)"""
+    title = FEAT_PATTERN.sub("", title)
+    title = FEAT_BRACKET_PATTERN.sub("", title)
+    title = VERSION_PATTERN.sub("", title)
+    title = SUFFIX_PATTERN.sub("", title)
+    title = PART_VOL_PATTERN.sub("", title)
+    title = title.strip(' -')
+    return title.strip()
+
+LEET_TABLE = str.maketrans("013457@$", "oieastas")
+LEET_CHAR_PATTERN = re.compile(r"[0-9@$]")
+LEET_RUN_PATTERN = re.compile(r"[a-z0-9@$]*[a-z][a-z0-9@$]*")  # Runs with at least one letter; bare numbers stay numbers
+# Scripts written without spaces between words; words in them match as substrings
+UNSPACED_SCRIPTS = ("CJK UNIFIED IDEOGRAPH", "CJK COMPATIBILITY IDEOGRAPH", "HIRAGANA", "KATAKANA", "HANGUL",
+                    "THAI", "LAO", "KHMER", "MYANMAR")
+
+@lru_cache(maxsize=16384)
+def fold_text_unit(unit, fold_accents):
+    """NFKC + casefold one base character with its combining marks, optionally dropping Latin accents"""
+    folded = unicodedata.normalize("NFKC", unit).casefold()
+    if fold_accents and not folded.isascii():
+        decomposed = unicodedata.normalize("NFKD", folded)
+        if decomposed and unicodedata.name(decomposed[0], "").startswith("LATIN"):
+            folded = unicodedata.normalize("NFC", "".join(ch for ch in decomposed if not unicodedata.combining(ch)))
+    return folded
+
+@lru_cache(maxsize=65536)
+def is_unspaced_script(ch):
+    return unicodedata.name(ch, "").startswith(UNSPACED_SCRIPTS)
+
+def joins_word(ch):
+    """True when `ch` would continue a word; characters of unspaced scripts never extend a neighbouring word"""
+    if ch.isascii(): return ch.isalnum() or ch == '_'
+    return ch.isalnum() and not is_unspaced_script(ch)
+
+# What may touch either end of a flagged word: nothing that continues a word (spaced
+# scripts), anything (unspaced scripts), or nothing of any script but punctuation/space
+BOUND_WORD, BOUND_NONE, BOUND_ALONE = 0, 1, 2
+
+def word_bound(key, ch):
+    """Bound at the end of `key` that is the character `ch`"""
+    if not is_unspaced_script(ch): return BOUND_WORD
+    # A lone syllable or ideograph (性, 糞, 씹, หี) is part of too many harmless words to match inside text
+    base_chars = sum(not unicodedata.category(c).startswith("M") for c in key)
+    return BOUND_ALONE if base_chars == 1 else BOUND_NONE
+
+def bound_ok(ch, bound):
+    """True when neighbour `ch` ("" at either end of the text) may touch a word with `bound`"""
+    if not ch or bound == BOUND_NONE: return True
+    return not joins_word(ch) and (bound == BOUND_WORD or not is_unspaced_script(ch))
+
+def fold_leetspeak(text):
+    """Read leetspeak digits/symbols inside already folded words as letters ("sh1t" -> "shit"); one character per character"""
+    if not LEET_CHAR_PATTERN.search(text): return text
+    return LEET_RUN_PATTERN.sub(lambda m: m.group().translate(LEET_TABLE), text)
+
+class TextNormalizer:
+    """
+    Folds flagged words and lyrics to one comparable form before matching.
+
+    NFKC + casefold always; Latin accents are dropped too with `fold_accents`. ASCII
+    text takes a fast path; other text is folded one character cluster at a time and
+    keeps a map back to the original offsets.
+    """
+
+    def __init__(self, fold_accents):
+        self.fold_accents = fold_accents
+
+    def key(self, word):
+        """Folded form of a flagged word, with runs of whitespace collapsed"""
+        return " ".join(self.normalize(word)[0].split())
+
+    def normalize(self, text):
+        """
+        Returns (folded text, offsets) where offsets is None when every folded character
+        sits at the same index as in `text`, else (starts, ends): the span in `text` that
+        produced each folded character.
+        """
+        if text.isascii(): return text.lower(), None
+        parts = []; starts = []; ends = []
+        i = 0; text_len = len(text); combining = unicodedata.combining
+        while i < text_len:
+            j = i + 1
+            while j < text_len and combining(text[j]): j += 1
+            folded = fold_text_unit(text[i:j], self.fold_accents)
+            parts.append(folded); starts.extend([i] * len(folded)); ends.extend([j] * len(folded))
+            i = j
+        return "".join(parts), (starts, ends)
+
+def build_automaton(keys):
+    """Aho-Corasick (goto, fail, out) tables for {word_id: key}"""
+    goto = [{}]; out = [[]]
+    for word_id, word in keys.items():
+        node = 0
+        for ch in word:
+            nxt = goto[node].get(ch)
+            if nxt is None:
+                nxt = len(goto); goto[node][ch] = nxt
+                goto.append({}); out.append([])
+            node = nxt
+        out[node].append(word_id)
+    # Breadth-first pass to wire failure links and merge suffix outputs
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        node = queue.popleft()
+        for ch, child in goto[node].items():
+            queue.append(child)
+            f = fail[node]
+            while f and ch not in goto[f]: f = fail[f]
+            fail[child] = goto[f].get(ch, 0)
+            out[child].extend(out[fail[child]])
+    return goto, fail, [tuple(o) for o in out]
+
+class FlaggedWordMatcher:
+    """
+    Aho-Corasick automaton over a flagged word set.
+
+    Built once per word set; words and lyrics are folded by the same TextNormalizer,
+    and a single left-to-right pass over the folded text finds every flagged word and
+    phrase that sits on word boundaries, so the cost of a scan grows with the lyrics,
+    not with the size of the word list. Ends of words in unspaced scripts (Chinese,
+    Japanese, Korean, Thai, ...) match without a boundary, except that a word of a
+    single character there (性, 씹) only matches where no letter touches it.
+
+    Accents are folded per word: a word matches any accented spelling ("fuck" finds
+    "fück") unless its exact spelling matters, i.e. the word has Latin accents itself
+    or shares its folded form with one that does ("coño" and "cono"). Those words
+    only match text that has the same accents.
+
+    Leetspeak is only read on the lyrics side. Words that contain digits or symbols
+    themselves ("3p", "2g1c") are kept literal in a second, small automaton that only
+    runs over lines that have such characters.
+    """
+
+    def __init__(self, flagged_words):
+        flagged_words = {w for w in flagged_words if w}
+        self.normalizer = TextNormalizer(fold_accents=True)
+        self.exact_normalizer = TextNormalizer(fold_accents=False)
+        # Spellings that differ only in case or width ("Fuck", "fuck") share one entry, shown as the first listed spelling
+        by_exact_key = {}
+        for word in sorted(flagged_words):
+            exact_key = self.exact_normalizer.key(word)
+            if exact_key: by_exact_key.setdefault(exact_key, word)
+        exact_keys = sorted(by_exact_key)
+        keys = [self.normalizer.key(exact_key) for exact_key in exact_keys]
+        spellings = {}  # folded key -> how many entries fold to it
+        for key in keys: spellings[key] = spellings.get(key, 0) + 1
+        self.words = tuple(by_exact_key[exact_key] for exact_key in exact_keys)
+        self.phrase_ids = frozenset(i for i, key in enumerate(keys) if ' ' in key)
+        # Exact key per word whose accents matter, else None
+        self._exact_keys = [exact_key if exact_key != key or spellings[key] > 1 else None for exact_key, key in zip(exact_keys, keys)]
+        self._lengths = [len(key) for key in keys]
+        self._left_bounds = [word_bound(key, key[0]) for key in keys]
+        self._right_bounds = [word_bound(key, key[-1]) for key in keys]
+        self.fold_leetspeak = MATCH_FOLD_LEETSPEAK
+        literal = {i for i, key in enumerate(keys) if self.fold_leetspeak and LEET_CHAR_PATTERN.search(key)}
+        self._automaton = build_automaton({i: key for i, key in enumerate(keys) if i not in literal})
+        self._literal_automaton = build_automaton({i: keys[i] for i in literal}) if literal else None
+
+    def __len__(self):
+        return len(self.words)
+
+    def approx_size(self):
+        """Rough memory footprint in bytes, used to bound the matcher cache"""
+        getsize = sys.getsizeof
+        size = (getsize(self._lengths) + getsize(self._left_bounds) + getsize(self._right_bounds)
+                + getsize(self._exact_keys) + getsize(self.words) + sum(map(getsize, self.words)))
+        for automaton in (self._automaton, self._literal_automaton):
+            if automaton is None: continue
+            goto, fail, out = automaton
+            size += getsize(goto) + sum(map(getsize, goto)) + getsize(fail) + getsize(out) + sum(map(getsize, out))
+        return size
+
+    def iter_matches(self, text):
+        """Yield (start, end, word_id) for every boundary-respecting hit in `text`, with offsets into `text` as given."""
+        folded, offsets = self.normalizer.normalize(text)
+        if not self.fold_leetspeak:
+            yield from self._verified(text, offsets, folded, self._automaton, False); return
+        leet_folded = fold_leetspeak(folded)
+        hits = self._verified(text, offsets, leet_folded, self._automaton, True)
+        if self._literal_automaton is None or leet_folded is folded: yield from hits; return
+        # Lines with digits or symbols also go through the literal words; hits stay in end order
+        literal_hits = self._verified(text, offsets, folded, self._literal_automaton, False)
+        yield from heapq.merge(hits, literal_hits, key=lambda hit: hit[1])
+
+    def _verified(self, text, offsets, scanned, automaton, leet_folded):
+        """Hits of `automaton` in `scanned`, mapped back to `text`, keeping only those whose accents match where they must"""
+        exact_keys = self._exact_keys
+        if offsets is None:
+            # ASCII text has no accents, so it is already in exact form
+            for start, end, word_id in self._scan(scanned, automaton):
+                if exact_keys[word_id] is None or exact_keys[word_id] == scanned[start:end]: yield start, end, word_id
+            return
+        starts, ends = offsets
+        for start, end, word_id in self._scan(scanned, automaton):
+            start, end = starts[start], ends[end - 1]
+            if exact_keys[word_id] is not None:
+                exact = self.exact_normalizer.key(text[start:end])
+                if exact_keys[word_id] != (fold_leetspeak(exact) if leet_folded else exact): continue
+            yield start, end, word_id
+
+    def _scan(self, text, automaton):
+        goto, fail, out = automaton
+        lengths, left_bounds, right_bounds = self._lengths, self._left_bounds, self._right_bounds
+        text_len = len(text); node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]: node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]: continue
+            end = pos + 1
+            after = text[end] if end < text_len else ""
+            for word_id in out[node]:
+                if not bound_ok(after, right_bounds[word_id]): continue
+                start = end - lengths[word_id]
+                if bound_ok(text[start - 1] if start else "", left_bounds[word_id]):
+                    yield start, end, word_id
+
+    def find_words(self, text):
+        """Return the distinct flagged words in `text`, in order of first occurrence."""
+        found = {}
+        for _, _, word_id in self.iter_matches(text):
+            found.setdefault(word_id, None)
+        return [self.words[i] for i in found]
+
+MATCH_FORMATS = ("records", "columnar")
+
+class TrackMatches:
+    """
+    Every flagged-word occurrence in one track's lyrics, held column-wise in typed arrays.
+
+    `line` indexes the synced lines that have text, or the newline-separated lines of
+    plain lyrics; `start`/`end` are character offsets within that line. `timestamp` is
+    the line's time in seconds, NaN for plain lyrics. A single word inside a phrase
+    hit on the same line is not recorded separately.
+    """
+    __slots__ = ("line", "start", "end", "word_id", "timestamp")
+
+    def __init__(self):
+        self.line = array("I"); self.start = array("I"); self.end = array("I")
+        self.word_id = array("I"); self.timestamp = array("d")
+
+    def __len__(self):
+        return len(self.line)
+
+    def add_hits(self, matcher, line_index, hits, timestamp=math.nan):
+        """Record the (start, end, word_id) hits found on one line"""
+        phrase_spans = [(start, end) for start, end, word_id in hits if word_id in matcher.phrase_ids]
+        for start, end, word_id in hits:
+            if phrase_spans and word_id not in matcher.phrase_ids and any(ps <= start and end <= pe for ps, pe in phrase_spans): continue
+            self.line.append(line_index); self.start.append(start); self.end.append(end)
+            self.word_id.append(word_id); self.timestamp.append(timestamp)
+
+    def encode(self, words, match_format):
+        """JSON-ready form: a list of dicts ("records") or parallel arrays with a word table ("columnar")"""
+        synced = len(self) > 0 and not math.isnan(self.timestamp[0])
+        if match_format == "records":
+            records = [{"line": line, "start": start, "end": end, "word": words[word_id]}
+                       for line, start, end, word_id in zip(self.line, self.start, self.end, self.word_id)]
+            if synced:
+                for record, timestamp in zip(records, self.timestamp): record["timestamp"] = round(timestamp, 3)
+            return records
+        table = {}
+        word_column = [table.setdefault(word_id, len(table)) for word_id in self.word_id]
+        columns = {"words": [words[word_id] for word_id in table], "word": word_column,
+                   "line": self.line.tolist(), "start": self.start.tolist(), "end": self.end.tolist()}
+        if synced: columns["timestamp"] = [round(t, 3) for t in self.timestamp]
+        return columns
+
+class LyricsCache(SQLiteStore):
+    """
+    Persistent SQLite cache in front of LRCLIB, keyed by title/artist/album/duration.
+
+    Found lyrics live for `ttl` seconds, "not found" answers for `negative_ttl`;
+    once the table grows past `max_entries` the least recently read rows are evicted.
+    The SQLite file is safe to share with the LRCLIB worker pool and across
+    gunicorn workers on the same host.
+    """
+    EVICT_EVERY = 200  # Writes between eviction sweeps
+
+    def __init__(self, path, ttl, negative_ttl, max_entries):
+        super().__init__(path)
+        self.ttl = ttl; self.negative_ttl = negative_ttl; self.max_entries = max_entries
+        self._writes = 0
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS lyrics_cache (
+                key TEXT PRIMARY KEY, lrclib_id INTEGER, synced TEXT, plain TEXT,
+                expires_at REAL NOT NULL, last_access REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS lyrics_cache_last_access ON lyrics_cache (last_access);
+        """)
+
+    @staticmethod
+    def make_key(title, artist, album, duration):
+        return "\x1f".join((title.strip().lower(), artist.strip().lower(), (album or "").strip().lower(), str(int(duration))))
+
+    def get(self, key):
+        """Return (synced_lines, lrclib_id, plain_lyrics) for a fresh entry, or None on a miss."""
+        conn = self._conn(); now = time.time()
+        row = conn.execute("SELECT lrclib_id, synced, plain, expires_at FROM lyrics_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[3] < now: return None
+        conn.execute("UPDATE lyrics_cache SET last_access = ? WHERE key = ?", (now, key))
+        synced_lines = [tuple(line) for line in json.loads(row[1])] if row[1] else None
+        return synced_lines, row[0], row[2]
+
+    def put(self, key, synced_lines, lrclib_id, plain):
+        """Store an LRCLIB answer; entries without any lyrics are cached with the shorter negative TTL."""
+        now = time.time()
+        ttl = self.ttl if (synced_lines or plain) else self.negative_ttl
+        self._conn().execute(
+            "INSERT OR REPLACE INTO lyrics_cache (key, lrclib_id, synced, plain, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, lrclib_id, json.dumps(synced_lines) if synced_lines else None, plain, now + ttl, now))
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0: self.evict()
+
+    def evict(self):
+        """Drop expired rows, then the least recently read rows beyond `max_entries`."""
+        conn = self._conn()
+        conn.execute("DELETE FROM lyrics_cache WHERE expires_at < ?", (time.time(),))
+        excess = conn.execute("SELECT COUNT(*) FROM lyrics_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute("DELETE FROM lyrics_cache WHERE key IN (SELECT key FROM lyrics_cache ORDER BY last_access LIMIT ?)", (excess,))
+            log.info(f"Lyrics cache: evicted {excess} least recently used entries.")
+
+_lyrics_cache = None
+_lyrics_cache_opened = False
+_lyrics_cache_lock = threading.Lock()
+
+def get_lyrics_cache():
+    """The persistent lyrics cache, opened on first use; None when disabled or it could not be opened"""
+    global _lyrics_cache, _lyrics_cache_opened
+    if _lyrics_cache_opened: return _lyrics_cache
+    with _lyrics_cache_lock:
+        if not _lyrics_cache_opened and LYRICS_CACHE_PATH:
+            try:
+                _lyrics_cache = LyricsCache(LYRICS_CACHE_PATH, LYRICS_CACHE_TTL, LYRICS_CACHE_NEGATIVE_TTL, LYRICS_CACHE_MAX_ENTRIES)
+            except sqlite3.Error as e:
+                log.warning(f"⚠️ Lyrics cache disabled, could not open {LYRICS_CACHE_PATH}: {e}")
+        _lyrics_cache_opened = True
+        return _lyrics_cache
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution whose result every caller shares."""
+
+    def __init__(self):
+        self._calls = {}  # key -> Future of the call in flight
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader: future = self._calls[key] = Future()
+        if not leader: return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock: self._calls.pop(key, None)
+
+lrclib_inflight = SingleFlight()
+
+def lrclib_track_url(lrclib_id):
+    return f"https.lrclib.net/track/{lrclib_id}" if lrclib_id else None
+
+class MatcherCache:
+    """
+    LRU of compiled matchers keyed by word-selection fingerprint, bounded by approximate memory.
+
+    DJs re-run the same list selection all day, so a hit skips the list union and
+    the automaton build entirely.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # fingerprint -> (matcher, size)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None: return None
+            self._entries.move_to_end(fingerprint)
+            return entry[0]
+
+    def put(self, fingerprint, matcher):
+        size = matcher.approx_size()
+        if size > self.max_bytes: return
+        with self._lock:
+            old = self._entries.pop(fingerprint, None)
+            if old: self._total -= old[1]
+            self._entries[fingerprint] = (matcher, size); self._total += size
+            while self._total > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total -= evicted_size
+
+matcher_cache = MatcherCache(MATCHER_CACHE_MAX_BYTES)
+
+def parse_custom_words(custom_words_str):
+    """Comma- or newline-separated custom words, stripped and lowercased"""
+    processed_str = custom_words_str.replace(",", "\n")
+    return {line.strip().lower() for line in processed_str.splitlines() if line.strip()}
+
+def get_flagged_matcher(custom_words_str, selected_defaults):
+    """
+    Resolve a request's word selection to a compiled matcher, reusing cached ones.
+
+    Custom words replace the defaults; otherwise the selected default lists are unioned.
+    The fingerprint covers the word list index version, so edited lists never hit stale
+    matchers. Returns (matcher, fingerprint), or (None, None) when no words are selected.
+    """
+    index_version = word_list_index.version
+    if custom_words_str.strip():
+        log.info("Using custom word list provided by user.")
+        custom_words = parse_custom_words(custom_words_str); lang_codes = []
+        if not custom_words: return None, None
+        key_material = "custom\0" + "\n".join(sorted(custom_words))
+    else:
+        log.info(f"Using selected default lists: {selected_defaults}")
+        default_lists = word_list_index.lists; custom_words = None
+        for lang_code in selected_defaults:
+            if lang_code not in default_lists:
+                log.warning(f"Warning: Requested default list '{lang_code}' not found/loaded on backend.")
+        lang_codes = sorted({lang_code for lang_code in selected_defaults if lang_code in default_lists})
+        if not lang_codes: return None, None
+        key_material = f"defaults\0{index_version}\0" + "\0".join(lang_codes)
+    fingerprint = hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    matcher = matcher_cache.get(fingerprint)
+    if matcher is not None:
+        log.debug(f"Reusing compiled matcher {fingerprint[:12]} ({len(matcher)} words).")
+        cache_requests_total.inc(cache="matcher", result="hit")
+        return matcher, fingerprint
+    # A single default list already has a compiled matcher in the word list index
+    if custom_words is None and len(lang_codes) == 1:
+        matcher, built = word_list_index.matcher_for(lang_codes[0])
+        cache_requests_total.inc(cache="matcher", result="miss" if built else "hit")
+        return matcher, fingerprint
+    cache_requests_total.inc(cache="matcher", result="miss")
+    flagged_words = custom_words if custom_words is not None else set().union(*(default_lists[lang_code] for lang_code in lang_codes))
+    matcher = FlaggedWordMatcher(flagged_words)
+    matcher_cache.put(fingerprint, matcher)
+    log.info(f"Compiled matcher {fingerprint[:12]} ({len(matcher)} words).")
+    return matcher, fingerprint
+
+def get_lyrics_from_lrclib(title, artist, album, duration):
+    """
+    Fetches lyrics from LRCLIB using connection pooling, answering from the lyrics cache when possible.
+
+    Returns:
+        tuple: (synced_lines, lrclib_url, plain_lyrics)
+               synced_lines: List of (timestamp, text) tuples, or None
+               lrclib_url: URL to the track on LRCLIB, or None
+               plain_lyrics: String of plain lyrics, or None
+    """
+    lyrics_cache = get_lyrics_cache()
+    cache_key = LyricsCache.make_key(title, artist, album, duration) if lyrics_cache else None
+    if cache_key:
+        try:
+            cached = lyrics_cache.get(cache_key)
+        except sqlite3.Error as e:
+            log.warning(f"⚠️ Lyrics cache read failed for '{title}': {e}"); cached = None
+        cache_requests_total.inc(cache="lyrics", result="miss" if cached is None else "hit")
+        if cached is not None:
+            synced_lines, lrclib_id, plain = cached
+            log.debug(f"LRCLIB cache hit for '{title}'.")
+            return synced_lines, lrclib_track_url(lrclib_id), plain
+
+    # Concurrent lookups of the same song (e.g. two jobs on overlapping playlists) share one request
+    inflight_key = LyricsCache.make_key(title, artist, album, duration)
+    return lrclib_inflight.do(inflight_key, lambda: request_lyrics_from_lrclib(title, artist, album, duration, cache_key))
+
+def request_lyrics_from_lrclib(title, artist, album, duration, cache_key=None):
+    """Query the LRCLIB API (see get_lyrics_from_lrclib), writing the answer to the lyrics cache under `cache_key`"""
+    url = f"{LRCLIB_API_URL}/get"
+    params = { "track_name": title, "artist_name": artist, "album_name": album, "duration": int(duration) }
+    headers = {"User-Agent": "FCCSongChecker/1.0 (Backend)"}
+    try:
+        # Use session for connection pooling
+        response = outbound.call("lrclib", lambda: requests_session.get(url, params=params, headers=headers, timeout=10))
+        log.debug(f"LRCLIB request for '{title}' status: {response.status_code}")
+        if response.status_code != 200:
+            # Only a definite "not found" is worth remembering; server errors are retried next time
+            if response.status_code == 404: cache_lrclib_result(cache_key, None, None, None)
+            return None, None, None
+
+        data = response.json()
+        lrclib_id = data.get('id')
+        synced = data.get("syncedLyrics")
+        plain = data.get("plainLyrics")
+
+        synced_lines = None
+        if synced:
+            # Use pre-compiled regex pattern
+            matches = LRCLIB_TIME_PATTERN.findall(synced)
+            synced_lines = [(int(m) * 60 + float(s), txt.strip()) for m, s, txt in matches if txt.strip()]
+            if synced_lines:
+                log.debug(f"LRCLIB SUCCESS for '{title}' - Found {len(synced_lines)} synced lines.")
+            else:
+                 synced_lines = None # Ensure it's None if parsing fails
+                 log.debug(f"LRCLIB found entry for '{title}' but synced lyrics parsing failed or was empty.")
+        else:
+             log.debug(f"LRCLIB found entry for '{title}' but no synced lyrics field.")
+
+        if plain: log.debug(f"LRCLIB also found plain lyrics for '{title}'.")
+        else: log.debug(f"LRCLIB did not find plain lyrics field for '{title}'.")
+
+        cache_lrclib_result(cache_key, synced_lines, lrclib_id, plain)
+        return synced_lines, lrclib_track_url(lrclib_id), plain
+
+    except Exception as e:
+        log.warning(f"⚠️ LRCLIB fetch EXCEPTION for '{title}': {e}")
+        return None, None, None
+
+def cache_lrclib_result(cache_key, synced_lines, lrclib_id, plain):
+    """Write an LRCLIB answer to the lyrics cache; cache failures never fail the lookup"""
+    if not cache_key: return
+    try:
+        get_lyrics_cache().put(cache_key, synced_lines, lrclib_id, plain)
+    except sqlite3.Error as e:
+        log.warning(f"⚠️ Lyrics cache write failed: {e}")
+
+class LocalLyricsIndex(SQLiteStore):
+    """
+    Offline lyrics store with the same answers as LRCLIB, for bulk screening without network access.
+
+    Rows are keyed by normalized title and artist (accents, punctuation and case removed)
+    with duration as a range-scanned index column, so lookups tolerate the small
+    duration differences between Spotify and LRCLIB. Synced lyrics are stored pre-parsed.
+    A row is unique per LRCLIB id (per title/artist/album/duration for rows without one),
+    so re-importing a refreshed dump replaces rows instead of duplicating them.
+    """
+    IMPORT_BATCH = 5000
+
+    def __init__(self, path, duration_tolerance):
+        super().__init__(path)
+        self.duration_tolerance = duration_tolerance
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS lyrics (
+                title_key TEXT NOT NULL, artist_key TEXT NOT NULL, album_key TEXT NOT NULL, duration REAL NOT NULL,
+                lrclib_id INTEGER, synced TEXT, plain TEXT);
+            CREATE INDEX IF NOT EXISTS lyrics_lookup ON lyrics (title_key, artist_key, duration);
+        """)
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'lyrics_lrclib_id'").fetchone():
+            # Indexes built before re-imports replaced rows may hold duplicates; keep the newest copy of each
+            conn.executescript("""
+                BEGIN;
+                DELETE FROM lyrics WHERE lrclib_id IS NOT NULL AND rowid NOT IN (SELECT MAX(rowid) FROM lyrics WHERE lrclib_id IS NOT NULL GROUP BY lrclib_id);
+                DELETE FROM lyrics WHERE lrclib_id IS NULL AND rowid NOT IN (
+                    SELECT MAX(rowid) FROM lyrics WHERE lrclib_id IS NULL GROUP BY title_key, artist_key, album_key, duration);
+                CREATE UNIQUE INDEX lyrics_lrclib_id ON lyrics (lrclib_id);
+                CREATE UNIQUE INDEX lyrics_unnumbered ON lyrics (title_key, artist_key, album_key, duration) WHERE lrclib_id IS NULL;
+                COMMIT;
+            """)
+
+    @staticmethod
+    def normalize(text):
+        text = unicodedata.normalize("NFKD", text or "").casefold()
+        text = "".join(ch if ch.isalnum() else " " for ch in text if not unicodedata.combining(ch))
+        return " ".join(text.split())
+
+    def lookup(self, title, artist, album, duration):
+        """Return (synced_lines, lrclib_id, plain_lyrics) for the closest match, or None"""
+        row = self._conn().execute(
+            "SELECT lrclib_id, synced, plain FROM lyrics WHERE title_key = ? AND artist_key = ? AND duration BETWEEN ? AND ? "
+            "ORDER BY album_key = ? DESC, ABS(duration - ?) LIMIT 1",
+            (self.normalize(title), self.normalize(artist), duration - self.duration_tolerance, duration + self.duration_tolerance,
+             self.normalize(album), duration)).fetchone()
+        if row is None: return None
+        synced_lines = [tuple(line) for line in json.loads(row[1])] if row[1] else None
+        return synced_lines, row[0], row[2]
+
+    def _rows(self, records):
+        for lrclib_id, title, artist, album, duration, synced, plain in records:
+            if not title or not artist or duration is None or not (synced or plain): continue
+            synced_lines = [(int(m) * 60 + float(s), txt.strip()) for m, s, txt in LRCLIB_TIME_PATTERN.findall(synced or "") if txt.strip()]
+            yield (self.normalize(clean_track_title(title)), self.normalize(artist), self.normalize(album), float(duration),
+                   lrclib_id, json.dumps(synced_lines) if synced_lines else None, plain or None)
+
+    def import_records(self, records):
+        """Insert (lrclib_id, title, artist, album, duration, synced_lyrics, plain_lyrics) tuples; returns the row count"""
+        conn = self._conn(); rows = self._rows(records); imported = 0
+        while True:
+            batch = list(itertools.islice(rows, self.IMPORT_BATCH))
+            if not batch: break
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO lyrics VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            conn.execute("COMMIT")
+            imported += len(batch)
+            log.info(f"Imported {imported} lyrics...")
+        return imported
+
+    def import_lrclib_dump(self, dump_path):
+        """Import the current lyrics of every track in an LRCLIB SQLite database dump"""
+        dump = sqlite3.connect(f"file:{dump_path}?mode=ro", uri=True)
+        try:
+            return self.import_records(dump.execute(
+                "SELECT t.id, t.name, t.artist_name, t.album_name, t.duration, l.synced_lyrics, l.plain_lyrics "
+                "FROM tracks t JOIN lyrics l ON l.id = t.last_lyrics_id"))
+        finally:
+            dump.close()
+
+    def import_jsonl(self, jsonl_path):
+        """Import a JSON-lines corpus using LRCLIB API field names (trackName, artistName, albumName, duration, syncedLyrics, plainLyrics, id)"""
+        def records():
+            with open(jsonl_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip(): continue
+                    r = json.loads(line)
+                    yield (r.get("id"), r.get("trackName") or r.get("name"), r.get("artistName"), r.get("albumName"),
+                           r.get("duration"), r.get("syncedLyrics"), r.get("plainLyrics"))
+        return self.import_records(records())
+
+_local_lyrics_index = None
+_local_lyrics_index_lock = threading.Lock()
+
+def get_local_lyrics_index():
+    global _local_lyrics_index
+    with _local_lyrics_index_lock:
+        if _local_lyrics_index is None: _local_lyrics_index = LocalLyricsIndex(LOCAL_LYRICS_DB, LOCAL_LYRICS_DURATION_TOLERANCE)
+        return _local_lyrics_index
+
+def get_lyrics_from_local_index(title, artist, album, duration):
+    """Same contract as get_lyrics_from_lrclib, answered from the offline lyrics index without any network access"""
+    try:
+        found = get_local_lyrics_index().lookup(title, artist, album, duration)
+    except sqlite3.Error as e:
+        log.warning(f"⚠️ Local lyrics lookup failed for '{title}': {e}"); return None, None, None
+    if found is None: return None, None, None
+    synced_lines, lrclib_id, plain = found
+    return synced_lines, lrclib_track_url(lrclib_id), plain
+
+def get_lyrics(title, artist, album, duration):
+    """Fetch lyrics from the configured LYRICS_PROVIDER; returns (synced_lines, lrclib_url, plain_lyrics)"""
+    if LYRICS_PROVIDER == "local": return get_lyrics_from_local_index(title, artist, album, duration)
+    return get_lyrics_from_lrclib(title, artist, album, duration)
+
+# --- REMOVED: get_lyrics_from_genius function ---
+
+# --- MODIFIED: analyze_track_lyrics NO Genius fallback ---
+def analyze_track_lyrics(track_obj, track_number, flagged_words, match_format=None):
+    """
+    Optimized track lyrics analysis with efficient word matching.
+
+    With a `match_format` from MATCH_FORMATS the result also carries every occurrence
+    under "matches" (see TrackMatches).
+    """
+    if not track_obj:
+        return {"track_number": track_number, "track_name": "Track not available", "status": "Error", "flagged_words": [], "lrclib_url": None}
+
+    track_name = track_obj.get("name", "Unknown Track")
+    main_artist = track_obj.get("artists", [{}])[0].get("name", "Unknown Artist")
+    album_name = track_obj.get("album", {}).get("name", "")
+    duration = track_obj.get("duration_ms", 0) / 1000
+    title_clean_search = clean_track_title(track_name)
+    log.debug(f"--- Analyzing Track {track_number}: '{track_name}' by '{main_artist}' (Cleaned: '{title_clean_search}') ---")
+    log.debug(f"Starting lyric search for '{track_name}'")
+
+    # --- Try LRCLIB ---
+    with timed_stage("lyrics_lookup"):
+        lrclib_lines, lrclib_url, plain_lyrics = get_lyrics(title_clean_search, main_artist, album_name, duration)
+    with timed_stage("match", lyrics_match_seconds):
+        return match_track_lyrics(track_number, track_name, lrclib_lines, lrclib_url, plain_lyrics, flagged_words, match_format)
+
+def match_track_lyrics(track_number, track_name, lrclib_lines, lrclib_url, plain_lyrics, flagged_words, match_format=None):
+    """Build a track's result row from its fetched lyrics: synced lines first, then plain text, else 'Lyrics Not Found'"""
+    # One automaton pass per line/text instead of one regex per flagged word
+    matcher = flagged_words if isinstance(flagged_words, FlaggedWordMatcher) else FlaggedWordMatcher(flagged_words)
+    words = matcher.words
+
+    # --- 1. Process LRCLIB Synced Lyrics (Highest Priority) ---
+    if lrclib_lines is not None and len(lrclib_lines) > 0:
+        log.debug(f"Processing LRCLIB SYNCED results for '{track_name}'.")
+        unique_flagged = []; seen = set()
+        matches = TrackMatches() if match_format else None
+
+        for line_index, (time_sec, line_text) in enumerate(lrclib_lines):
+            hits = list(matcher.iter_matches(line_text))
+            if not hits: continue
+            if matches is not None: matches.add_hits(matcher, line_index, hits, time_sec)
+            hit_ids = [word_id for _, _, word_id in hits]
+            # Single words that are part of a phrase found on this line are already covered by the phrase
+            phrase_words = {part for word_id in hit_ids if word_id in matcher.phrase_ids for part in words[word_id].split()}
+            timestamp = round(time_sec, 3)
+            for word_id in hit_ids:
+                word = words[word_id]
+                if word_id not in matcher.phrase_ids and word in phrase_words: continue
+                if (timestamp, word) in seen: continue
+                seen.add((timestamp, word))
+                unique_flagged.append({"timestamp": timestamp, "context": word})
+
+        status = "Explicit" if unique_flagged else "Clean"
+        log.debug(f"LRCLIB SYNCED Result for '{track_name}': Status={status}, Found={len(unique_flagged)}.")
+        result = {"track_number": track_number, "track_name": track_name, "status": status,
+                  "flagged_words": unique_flagged, "lrclib_url": lrclib_url}
+        if matches is not None: result["matches"] = matches.encode(words, match_format)
+        return result
+
+    # --- 2. Process LRCLIB Plain Lyrics (If Synced Failed/Empty) ---
+    elif plain_lyrics is not None and plain_lyrics.strip():
+        log.debug(f"Processing LRCLIB PLAIN results for '{track_name}'.")
+        # One pass per line collects the distinct words (in order of first occurrence) and, when asked, every position;
+        # matches never span lines, so this finds the same words as scanning the whole text
+        matches = TrackMatches() if match_format else None
+        found = {}
+        for line_index, line_text in enumerate(plain_lyrics.split("\n")):
+            hits = list(matcher.iter_matches(line_text))
+            if not hits: continue
+            if matches is not None: matches.add_hits(matcher, line_index, hits)
+            for _, _, word_id in hits: found.setdefault(word_id, None)
+        found_words = [words[word_id] for word_id in found]
+
+        status = "Explicit" if found_words else "Clean"
+        log.debug(f"LRCLIB PLAIN Result for '{track_name}': Status={status}, Found={len(found_words)}.")
+        result = {"track_number": track_number, "track_name": track_name, "status": status,
+                  "flagged_words": found_words, "lrclib_url": lrclib_url}
+        if matches is not None: result["matches"] = matches.encode(words, match_format)
+        return result
+
+    # --- 3. Report Not Found (If ALL LRCLIB options failed/empty) ---
+    else:
+        log.debug(f"LRCLIB failed (no synced or plain lyrics) for '{track_name}'. Reporting 'Lyrics Not Found'.")
+        return {"track_number": track_number, "track_name": track_name, "status": "Lyrics Not Found",
+                 "flagged_words": [], "lrclib_url": lrclib_url}
+# --- End modification ---
+
+def analyze_track_safely(track_obj, track_number, flagged_matcher, match_format=None):
+    """Run analyze_track_lyrics for one track, turning bad track data or unexpected errors into an error row"""
+    if not track_obj or not track_obj.get('id') or not track_obj.get('name'):
+        log.warning(f"Warning: Skipping invalid/incomplete track object at index {track_number-1}")
+        return {"track_number": track_number, "track_name": "Track Data Unavailable", "status": "Error", "flagged_words": [], "lrclib_url": None}
+    if 'album' not in track_obj or track_obj['album'] is None: track_obj['album'] = {'name': '', 'images': []}
+    if 'artists' not in track_obj or not track_obj['artists']: track_obj['artists'] = [{'name': 'Unknown Artist'}]
+    current_track_name = track_obj.get("name", f"Track {track_number}")
+    try:
+        with timed_stage("track", track_analysis_seconds):
+            result = analyze_track_lyrics(track_obj, track_number, flagged_matcher, match_format)
+    except Exception as track_error:
+        log.exception(f"❌❌❌ UNEXPECTED Error analyzing track '{current_track_name}' (Index {track_number-1}): {track_error}")
+        result = {"track_number": track_number, "track_name": current_track_name, "status": "Analysis Error", "flagged_words": [], "lrclib_url": None}
+    tracks_analyzed_total.inc(status=result["status"])
+    return result
+
+def recording_key(track_obj):
+    """ISRC when Spotify has one, else cleaned title + main artist + duration rounded to seconds"""
+    isrc = (track_obj.get("external_ids") or {}).get("isrc")
+    if isrc: return f"isrc:{isrc.upper()}"
+    main_artist = ((track_obj.get("artists") or [{}])[0].get("name") or "").lower()
+    return "\x1f".join(("meta", clean_track_title(track_obj.get("name", "")).lower(), main_artist, str(round(track_obj.get("duration_ms", 0) / 1000))))
+
+def iter_track_analyses(numbered_tracks, flagged_matcher, max_workers=None, match_format=None):
+    """
+    Analyze (track_number, track_obj) pairs on a bounded thread pool so LRCLIB round-trips overlap.
+
+    Yields results in completion order; callers sort on `track_number` to restore
+    the original track order.
+    """
+    if not numbered_tracks: return
+    # Copies of one recording (repeats, single vs album cut) are analyzed once and fanned out
+    recordings = OrderedDict()
+    for idx, track_obj in numbered_tracks:
+        key = recording_key(track_obj) if track_obj and track_obj.get('id') and track_obj.get('name') else ("invalid", idx)
+        recordings.setdefault(key, []).append((idx, track_obj))
+    if len(recordings) < len(numbered_tracks):
+        log.info(f"De-duplicated {len(numbered_tracks)} tracks to {len(recordings)} unique recordings.")
+    workers = max(1, min(max_workers or LRCLIB_MAX_WORKERS, len(recordings)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lrclib")
+    try:
+        # Each lookup runs in a copy of this context so a profiled request follows it into the pool
+        futures = {executor.submit(contextvars.copy_context().run, analyze_track_safely, copies[0][1], copies[0][0], flagged_matcher, match_format): copies
+                   for copies in recordings.values()}
+        for future in as_completed(futures):
+            result = future.result()
+            yield result
+            for idx, track_obj in futures[future][1:]:
+                yield {**result, "track_number": idx, "track_name": track_obj.get("name", result["track_name"])}
+    finally:
+        # Drop queued work if the consumer stops early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# --- Spotify fetching ---
+class SpotifyMetadataCache:
+    """
+    TTL + LRU cache for Spotify catalog responses, optionally backed by a SQLite file.
+
+    Keys are entity IDs ("track:<id>", "album:<id>", ...); playlist contents are keyed by
+    their snapshot_id so an edited playlist is never served stale. Entries carry a weight
+    (about one per track object) and the least recently used ones are dropped once the
+    total passes `max_weight`. Misses fall through to the disk layer before Spotify.
+    """
+
+    def __init__(self, max_weight, disk_store=None):
+        self.max_weight = max_weight; self.disk_store = disk_store
+        self._entries = OrderedDict()  # key -> (expires_at, value, weight)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    cache_requests_total.inc(cache="spotify", result="hit")
+                    return entry[1]
+                self._total -= self._entries.pop(key)[2]
+        value = None
+        if self.disk_store is not None:
+            try: value = self.disk_store.get(key)
+            except sqlite3.Error as e: log.warning(f"⚠️ Spotify cache read failed for {key}: {e}")
+        cache_requests_total.inc(cache="spotify", result="miss" if value is None else "hit")
+        # Promote with the short TTL; the disk row keeps its own expiry
+        if value is not None: self._remember(key, value, SPOTIFY_PLAYLIST_TTL, self._weigh(value))
+        return value
+
+    def put(self, key, value, ttl):
+        weight = self._weigh(value)
+        self._remember(key, value, ttl, weight)
+        if self.disk_store is not None:
+            try: self.disk_store.set(key, value, ttl)
+            except sqlite3.Error as e: log.warning(f"⚠️ Spotify cache write failed for {key}: {e}")
+
+    @staticmethod
+    def _weigh(value):
+        return max(1, len(value)) if isinstance(value, list) else 1
+
+    def _remember(self, key, value, ttl, weight):
+        if weight > self.max_weight: return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old: self._total -= old[2]
+            self._entries[key] = (time.time() + ttl, value, weight); self._total += weight
+            while self._total > self.max_weight:
+                _, (_, _, evicted_weight) = self._entries.popitem(last=False)
+                self._total -= evicted_weight
+
+spotify_cache = SpotifyMetadataCache(
+    SPOTIFY_CACHE_MAX_WEIGHT,
+    SQLiteStateStore(SPOTIFY_CACHE_PATH, SPOTIFY_CACHE_TTL) if SPOTIFY_CACHE_PATH else None)
+
+def spotify_cached(key, ttl, fetch):
+    """Return the cached value for `key`, calling `fetch` (and caching a non-empty result) on a miss"""
+    value = spotify_cache.get(key)
+    if value is None:
+        value = fetch()
+        if value: spotify_cache.put(key, value, ttl)
+    return value
+
+def fetch_full_tracks(sp, track_ids):
+    """Full track objects for `track_ids` in order, asking Spotify (50 per call) only for uncached ones"""
+    cached = {track_id: spotify_cache.get(f"track:{track_id}") for track_id in track_ids}
+    missing = [track_id for track_id, track in cached.items() if track is None]
+    for offset in range(0, len(missing), 50):
+        batch_ids = missing[offset:offset+50]
+        try: batch_tracks = sp.tracks(batch_ids)
+        except spotipy.exceptions.SpotifyException as batch_error: log.warning(f"Warning: Error fetching batch of album tracks: {batch_error}"); continue
+        for track in batch_tracks['tracks']:
+            if not track or not track.get('id'): continue
+            spotify_cache.put(f"track:{track['id']}", track, SPOTIFY_CACHE_TTL); cached[track['id']] = track
+    return [cached[track_id] for track_id in track_ids if cached.get(track_id)]
+
+def track_item_header(track_info):
+    """Response header fields for a single-track item"""
+    if track_info.get("album"): return {"name": track_info["album"]["name"], "artist": track_info["artists"][0]["name"], "album_cover": track_info["album"]["images"][0]["url"] if track_info["album"]["images"] else None}
+    return {"name": track_info["name"], "artist": track_info["artists"][0]["name"], "album_cover": None}
+
+def fetch_album_header(sp, item_id):
+    """Returns (response header fields, track IDs) for an album"""
+    album_info = spotify_cached(f"album:{item_id}", SPOTIFY_CACHE_TTL, lambda: sp.album(item_id))
+    if not album_info: raise Exception(f"Album ID {item_id} not found or unavailable.")
+    album_track_ids = spotify_cached(f"album_tracks:{item_id}", SPOTIFY_CACHE_TTL,
+                                     lambda: [t['id'] for t in sp.album_tracks(item_id, limit=50)['items'] if t and t.get('id')])
+    header = {"name": album_info["name"], "artist": album_info["artists"][0]["name"], "album_cover": album_info["images"][0]["url"] if album_info["images"] else None}
+    return header, album_track_ids or []
+
+def fetch_tracks_for_item(sp, url_type, item_id):
+    """
+    Fetch Spotify metadata for a track, album or playlist.
+
+    Returns:
+        tuple: (response_data, tracks_to_process) where response_data holds the
+               item header (type, name, artist/owner, cover) for the response.
+    """
+    tracks_to_process = []; response_data = {"type": url_type}
+    log.info(f"Fetching '{url_type}' with ID: {item_id} from Spotify...")
+    if url_type == 'track':
+        track_info = spotify_cached(f"track:{item_id}", SPOTIFY_CACHE_TTL, lambda: sp.track(item_id)); tracks_to_process = [track_info] if track_info else []
+        if tracks_to_process: response_data.update(track_item_header(track_info))
+    elif url_type == 'album':
+        header, album_track_ids = fetch_album_header(sp, item_id)
+        tracks_to_process = fetch_full_tracks(sp, album_track_ids)
+        response_data.update(header)
+    elif url_type == 'playlist':
+        # The cache is shared by every user, so only public playlists go into it; a private one is
+        # always fetched with the requesting user's own token
+        playlist_info = spotify_cache.get(f"playlist:{item_id}")
+        if playlist_info is None:
+            playlist_info = sp.playlist(item_id, fields='name,owner.display_name,images,tracks.total,snapshot_id,public')
+            if playlist_info and playlist_info.get("public") is True: spotify_cache.put(f"playlist:{item_id}", playlist_info, SPOTIFY_PLAYLIST_TTL)
+        if not playlist_info: raise Exception(f"Playlist ID {item_id} not found or unavailable.")
+        response_data.update({"name": playlist_info["name"], "owner": playlist_info["owner"]["display_name"], "cover": playlist_info["images"][0]["url"] if playlist_info["images"] else None,
+                              "snapshot_id": playlist_info.get("snapshot_id")})
+        # Playlist contents only change with the snapshot, so an unchanged playlist is never paged again
+        snapshot_id = playlist_info.get("snapshot_id") if playlist_info.get("public") is True else None
+        items_key = f"playlist_items:{item_id}:{snapshot_id}"
+        tracks_to_process = spotify_cache.get(items_key) if snapshot_id else None
+        if tracks_to_process is None:
+            tracks_to_process, complete = fetch_playlist_tracks(sp, item_id)
+            if complete and snapshot_id: spotify_cache.put(items_key, tracks_to_process, SPOTIFY_CACHE_TTL)
+    log.info(f"Found {len(tracks_to_process)} tracks to process.")
+    return response_data, tracks_to_process
+
+def fetch_playlist_tracks(sp, playlist_id):
+    """Page through a playlist; returns (non-local track objects, whether every page was fetched)"""
+    items = []; offset = 0; limit = 100; complete = True
+    while True:
+        try:
+            results = sp.playlist_items(playlist_id, fields='items(is_local,track(id,name,artists,album(name,images),duration_ms,external_ids,external_urls)),next,offset,total', limit=limit, offset=offset)
+            current_items = results.get('items', [])
+            items.extend(item for item in current_items if item and not item.get('is_local') and item.get('track'))
+            if results.get('next') is None or len(current_items) == 0: break
+            offset += len(current_items)
+        except spotipy.exceptions.SpotifyException as page_error: log.warning(f"Warning: Error fetching playlist page (offset {offset}): {page_error}"); complete = False; break
+    return [item["track"] for item in items], complete
+
+# --- Library scans: track rows in, results out, spread over worker processes ---
+SCAN_CHUNK_SIZE = int(os.getenv("SCAN_CHUNK_SIZE", "500"))  # Tracks handed to a worker (and de-duplicated) at a time
+
+_scan_matcher = None  # The scan's matcher, inside a scan_process_pool worker
+
+def init_scan_process(flagged_matcher, processes):
+    global _scan_matcher, outbound
+    _scan_matcher = flagged_matcher
+    # Rate limits are enforced per process, so each worker gets an equal share of them
+    outbound = OutboundScheduler({"lrclib": LRCLIB_RATE_LIMIT / processes, "spotify": SPOTIFY_RATE_LIMIT / processes},
+                                 OUTBOUND_MAX_ATTEMPTS, CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN)
+
+def scan_chunk(numbered_tracks, max_workers=None, match_format=None):
+    """Analyze one chunk of (track_number, track_obj) pairs inside a worker process"""
+    return list(iter_track_analyses(numbered_tracks, _scan_matcher, max_workers, match_format))
+
+def scan_process_pool(flagged_matcher, processes):
+    """
+    Process pool for scan_chunk, each worker holding its own copy of `flagged_matcher`.
+
+    Workers are spawned rather than forked, since the parent already runs the
+    log listener thread.
+    """
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=init_scan_process, initargs=(flagged_matcher, processes))
+
+def track_from_record(record):
+    """
+    Spotify-shaped track object for one row of library metadata, so rows take the same path as Spotify tracks.
+
+    Spotify track objects pass through unchanged. Flat rows need a title (or name/track_name)
+    and artist, and may carry album, duration in seconds (duration) or milliseconds (duration_ms),
+    id and isrc; the id defaults to the ISRC, then the title.
+    """
+    if isinstance(record.get("artists"), list): return record
+    title = (record.get("title") or record.get("name") or record.get("track_name") or "").strip()
+    artist = (record.get("artist") or record.get("artist_name") or "").strip()
+    isrc = (record.get("isrc") or "").strip()
+    try:
+        duration_ms = float(record["duration_ms"]) if record.get("duration_ms") not in (None, "") else float(record.get("duration") or 0) * 1000
+    except (TypeError, ValueError):
+        duration_ms = 0
+    track = {"id": str(record.get("id") or isrc or title), "name": title, "artists": [{"name": artist}] if artist else [],
+             "album": {"name": (record.get("album") or record.get("album_name") or "").strip()}, "duration_ms": duration_ms}
+    if isrc: track["external_ids"] = {"isrc": isrc}
+    return track
+
+def scan_tracks(tracks, flagged_matcher, processes=None, max_workers=None, match_format=None, chunk_size=None):
+    """
+    Analyze an iterable of track objects (see track_from_record), yielding results as they finish.
+
+    Tracks are numbered from 1 in input order and each result also carries the track's "id".
+    The input is read `chunk_size` tracks at a time, so memory stays flat however long it is.
+    Each chunk is looked up and matched on one of `processes` worker processes (every core
+    by default), with `max_workers` lookups in flight per process; `processes=1` scans
+    in this process instead.
+    """
+    processes = processes or os.cpu_count() or 1
+    numbered_tracks = enumerate(tracks, 1)
+    chunks = iter(lambda: list(itertools.islice(numbered_tracks, chunk_size or SCAN_CHUNK_SIZE)), [])
+    if processes == 1:
+        for chunk in chunks: yield from with_track_ids(chunk, iter_track_analyses(chunk, flagged_matcher, max_workers, match_format))
+        return
+    pool = scan_process_pool(flagged_matcher, processes)
+    pending = {}  # Future -> chunk
+    def finished_chunks():
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done: yield from with_track_ids(pending.pop(future), future.result())
+    try:
+        for chunk in chunks:
+            pending[pool.submit(scan_chunk, chunk, max_workers, match_format)] = chunk
+            # Two chunks per worker keep every process busy while results are consumed
+            if len(pending) >= 2 * processes: yield from finished_chunks()
+        while pending: yield from finished_chunks()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def with_track_ids(numbered_tracks, results):
+    """Add each track's "id" to results for a chunk of consecutively numbered tracks"""
+    first = numbered_tracks[0][0]
+    for result in results:
+        track_obj = numbered_tracks[result["track_number"] - first][1]
+        yield {**result, "id": track_obj.get("id") if track_obj else None}
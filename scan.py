@@ -0,0 +1,81 @@
+"""
+Library-wide scans from the command line: track metadata in (CSV or JSONL), results out (NDJSON).
+
+    python scan.py library.csv -o results.ndjson                   # default English list, every core
+    python scan.py tracks.jsonl --lists en,es --matches records > results.ndjson
+    LYRICS_PROVIDER=local python scan.py library.csv -o results.ndjson --processes 8
+
+Rows need a title and artist; album, duration (seconds) or duration_ms, id and isrc
+are optional (see engine.track_from_record). JSONL lines may also be Spotify track
+objects. Results are written as they finish, one JSON object per line, carrying the
+row's track_number (1-based input order) and id. Logs go to stderr.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+# Results own stdout, so logs are sent to stderr before the engine configures them
+os.environ.setdefault("LOG_STREAM", "stderr")
+import engine  # noqa: E402
+
+PROGRESS_EVERY = 1000  # Tracks between progress log lines
+
+
+def read_records(path, fmt):
+    """Yield one dict per CSV row or JSONL line; unreadable lines yield {} so track numbers stay aligned"""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", newline="")
+    try:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+            return
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip(): continue
+            try: record = json.loads(line)
+            except ValueError as e: engine.log.warning(f"⚠️ Skipping unreadable JSON on line {line_number}: {e}"); record = {}
+            yield record if isinstance(record, dict) else {}
+    finally:
+        if f is not sys.stdin: f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan a track list for flagged words in its lyrics.")
+    parser.add_argument("input", help="CSV or JSONL track metadata, or - for stdin")
+    parser.add_argument("-o", "--output", help="NDJSON results file (default: stdout)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Input format (default: from the file extension, else jsonl)")
+    parser.add_argument("--lists", default="en", help="Comma-separated default word lists (default: en)")
+    parser.add_argument("--custom-words", help="File of custom words (comma- or newline-separated), used instead of --lists")
+    parser.add_argument("--matches", choices=engine.MATCH_FORMATS, help="Also report every match position in this format")
+    parser.add_argument("--processes", type=int, help="Matching processes (default: every core; 1 matches on the lookup threads)")
+    parser.add_argument("--workers", type=int, help="Concurrent lyrics lookups per process (default: LRCLIB_MAX_WORKERS)")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    custom_words = ""
+    if args.custom_words:
+        with open(args.custom_words, "r", encoding="utf-8") as f: custom_words = f.read()
+    flagged_matcher, _ = engine.get_flagged_matcher(custom_words, [code.strip() for code in args.lists.split(",") if code.strip()])
+    if flagged_matcher is None: parser.error("No flagged words: check --lists or --custom-words.")
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    statuses = {}; started = time.perf_counter()
+    try:
+        tracks = map(engine.track_from_record, read_records(args.input, fmt))
+        for count, result in enumerate(engine.scan_tracks(tracks, flagged_matcher, args.processes, args.workers, args.matches), start=1):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+            if count % PROGRESS_EVERY == 0:
+                out.flush()
+                engine.log.info(f"Scanned {count} tracks ({count / (time.perf_counter() - started):.1f} tracks/s).")
+    finally:
+        if out is not sys.stdout: out.close()
+        else: out.flush()
+    total = sum(statuses.values())
+    engine.log.info(f"✅ Scanned {total} tracks in {time.perf_counter() - started:.1f}s: "
+                    + ", ".join(f"{status} {n}" for status, n in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    main()
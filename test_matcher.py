@@ -0,0 +1,54 @@
+"""Flagged-word matching: python -m pytest test_matcher.py"""
+import os
+
+os.environ.setdefault("LYRICS_CACHE_PATH", "")
+import engine  # noqa: E402
+import pytest  # noqa: E402
+
+
+def default_matcher(*lang_codes):
+    matcher, _ = engine.get_flagged_matcher("", list(lang_codes))
+    return matcher
+
+
+@pytest.mark.parametrize("lang_code, text", [
+    ("zh", "我的个性很好"),  # 性 in "personality"
+    ("zh", "奶奶和爷爷"),  # 奶 in "grandma"
+    ("zh", "你在幹嘛"),  # 幹 in "what are you doing"
+    ("zh", "鸡蛋和卵石"),  # 卵 in "pebbles"
+    ("th", "หีบเพลง"),  # หี in "accordion"
+])
+def test_single_character_words_do_not_match_inside_unspaced_words(lang_code, text):
+    assert default_matcher(lang_code).find_words(text) == []
+
+
+@pytest.mark.parametrize("lang_code, text, expected", [
+    ("zh", "性", ["性"]),
+    ("zh", "他说 幹！", ["幹"]),
+    ("zh", "奶子", ["奶子"]),
+    ("th", "ไอ้ หี", ["หี"]),
+    ("ko", "씹새끼", ["씹새끼"]),
+])
+def test_unspaced_scripts_match_standalone_and_longer_words(lang_code, text, expected):
+    assert default_matcher(lang_code).find_words(text) == expected
+
+
+def test_word_boundaries_in_spaced_scripts():
+    matcher = engine.FlaggedWordMatcher({"ass"})
+    assert matcher.find_words("a class act") == []
+    assert matcher.find_words("kiss my ass!") == ["ass"]
+
+
+def test_accents_fold_per_word():
+    matcher = engine.FlaggedWordMatcher({"fuck", "coño"})
+    assert matcher.find_words("fück") == ["fuck"]
+    assert matcher.find_words("cono") == []
+    assert matcher.find_words("COÑO") == ["coño"]
+
+
+def test_leetspeak_is_read_in_lyrics_only():
+    matcher = engine.FlaggedWordMatcher({"shit", "3p", "2g1c"})
+    assert matcher.find_words("that sh1t") == ["shit"]
+    assert matcher.find_words("check out my new EP tonight") == []
+    assert matcher.find_words("a 3p and 2g1c") == ["3p", "2g1c"]
+    assert matcher.find_words("2gic") == []